@@ -0,0 +1,182 @@
+'''
+Physics backends for the ball update step
+    reference - the game's original one-ball-at-a-time Python loop, in native floats
+    numpy     - plinko_physics.step_balls(), the whole batch in a few NumPy calls
+    numba     - compiled kernels from plinko_kernels.py, only when the numba package is installed
+Every backend has step(), settle() and run_drops() with the contracts of step_balls(), settle_balls()
+and run_drops() in plinko_physics, and all of them land the same balls in the same bins for a
+BallStreams seed. 'auto' picks numba when it can be imported and numpy otherwise.
+Usage -
+    python plinko_backends.py --drops 100000   (ball-steps per second of every available backend)
+'''
+import argparse
+import time
+import warnings
+import numpy as np
+from plinko_physics import Board, BallBatch, BIAS_SCALE, step_balls, settle_balls, draw_nudges, drop_start, kick_stuck
+from plinko_rng import BallStreams
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+BACKENDS = ('reference', 'numpy', 'numba')
+
+
+class NumpyBackend:
+    """Batch step with NumPy arrays."""
+    name = 'numpy'
+
+    def step(self, balls, board, bias, rng=None):
+        return step_balls(balls, board, bias, rng)
+
+    def settle(self, balls, board, bias, rng=None, max_frames=10000):
+        return settle_balls(balls, board, bias, rng, max_frames, step=self.step)
+
+    def run_drops(self, board, x, y, bias, rng, max_frames=10000, ids=None):
+        balls = BallBatch(len(x))
+        balls.add(x, y, ids=ids)
+        return self.settle(balls, board, bias, rng, max_frames)
+
+
+class ReferenceBackend(NumpyBackend):
+    """Per-ball step in plain Python, the way the game loop used to move balls. Slow, kept as the reference."""
+    name = 'reference'
+
+    def step(self, balls, board, bias, rng=None):
+        if rng is None: rng = np.random.default_rng()
+        n = balls.count
+        x, y = balls.x[:n].tolist(), balls.y[:n].tolist()
+        vx, vy = balls.vx[:n].tolist(), balls.vy[:n].tolist()
+        kernel = board.kernel
+        hit, pin = [], []
+        for i in range(n):
+            x[i] += vx[i]
+            y[i] += vy[i]
+            vy[i] += board.gravity
+            touching = board.index.touching_one(x[i], y[i])
+            if touching >= 0:
+                hit.append(i)
+                pin.append(touching)
+        hit = np.array(hit, dtype=np.int64)
+        pin = np.array(pin, dtype=np.int64)
+        if len(hit):
+            for i, p, nudge in zip(hit.tolist(), pin.tolist(), draw_nudges(rng, balls, hit).tolist()):
+                x[i], y[i], vx[i], vy[i] = kernel.bounce(x[i], y[i], vx[i], vy[i], kernel.pin_x[p], kernel.pin_y[p], bias, nudge)
+        balls.x[:n], balls.y[:n], balls.vx[:n], balls.vy[:n] = x, y, vx, vy
+        kick_stuck(balls, board, slice(0, n), hit, pin)
+
+        # Remove the balls at the bottom
+        hit_ids = balls.ids[hit]
+        landed = balls.y[:n] > board.landing_y
+        bins = board.bin_of(balls.x[:n][landed])
+        ids = balls.ids[:n][landed]
+        if landed.any(): balls.remove(landed)
+        return pin, bins, ids, hit_ids
+
+
+class NumbaBackend(NumpyBackend):
+    """Compiled per-ball step. The ball streams are drawn inside the kernel, so it needs plain BallStreams;
+    with any other random source it falls back to the NumPy step."""
+    name = 'numba'
+
+    def __init__(self):
+        import plinko_kernels
+        self.kernels = plinko_kernels
+        self._board = None
+        self._board_arrays = None
+        self._out = self._outputs(0)
+        self.steps = 0  # Ball-steps taken by the last run_drops()
+
+    def _arrays(self, board):
+        if board is not self._board:
+            self._board, self._board_arrays = board, self.kernels.board_arrays(board)
+        return self._board_arrays
+
+    @staticmethod
+    def _outputs(n):
+        return np.empty(n, dtype=np.int64), np.empty(n, dtype=bool), np.empty(n, dtype=np.int64)
+
+    def step(self, balls, board, bias, rng=None):
+        if not (isinstance(rng, BallStreams) and rng.compiled): return step_balls(balls, board, bias, rng)
+        n = balls.count
+        if len(self._out[0]) < n: self._out = self._outputs(len(balls.x))
+        self.kernels.run_balls(n, 1, balls.x, balls.y, balls.vx, balls.vy, balls.ids, balls.draws, balls.contacts,
+                               balls.slow, rng.key, bias / BIAS_SCALE, *self._arrays(board), *self._out)
+        hit_pin, landed, bins = (out[:n] for out in self._out)
+        hit = np.flatnonzero(hit_pin >= 0)
+        pin, hit_ids = hit_pin[hit], balls.ids[hit]
+        bins, ids = bins[landed], balls.ids[:n][landed]
+        if landed.any(): balls.remove(landed)
+        return pin, bins, ids, hit_ids
+
+    def settle(self, balls, board, bias, rng=None, max_frames=10000):
+        """Whole drops inside the kernel, one ball at a time, with no Python work per frame."""
+        if not (isinstance(rng, BallStreams) and rng.compiled): return super().settle(balls, board, bias, rng, max_frames)
+        n = balls.count
+        hit_pin, landed, bins = self._outputs(n)
+        self.steps = self.kernels.run_balls(n, max_frames, balls.x, balls.y, balls.vx, balls.vy, balls.ids, balls.draws,
+                                            balls.contacts, balls.slow, rng.key, bias / BIAS_SCALE, *self._arrays(board),
+                                            hit_pin, landed, bins)
+        balls.clear()
+        return bins
+
+
+def get_backend(name='auto'):
+    """Backend by name, 'auto' is numba when it is installed and numpy otherwise.
+    Asking for numba without it installed warns and falls back to numpy."""
+    if name == 'auto': name = 'numba' if numba else 'numpy'
+    if name == 'numba' and numba is None:
+        warnings.warn("numba is not installed, using the numpy backend")
+        name = 'numpy'
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown backend {name!r}, expected 'auto' or one of {BACKENDS}")
+    return {'reference': ReferenceBackend, 'numpy': NumpyBackend, 'numba': NumbaBackend}[name]()
+
+
+def available_backends():
+    return [name for name in BACKENDS if name != 'numba' or numba]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the physics backends")
+    parser.add_argument('--rows', type=int, default=16, help="number of pin rows")
+    parser.add_argument('--bias', type=float, default=6, help="center bias (slider value)")
+    parser.add_argument('--drops', type=int, default=100000, help="balls per backend (the reference backend drops 1/20)")
+    parser.add_argument('--seed', type=int, default=0, help="seed, every backend drops the same balls")
+    args = parser.parse_args()
+
+    board = Board(args.rows)
+    streams = BallStreams(args.seed)
+    results = {}
+    for name in available_backends():
+        backend = get_backend(name)
+        drops = max(1, args.drops // 20) if name == 'reference' else args.drops
+        ids = np.arange(drops)
+        x, y = drop_start(board, drops, streams, ids)
+        backend.run_drops(board, x[:10], y[:10], args.bias, streams, ids=ids[:10])  # Warm up (compile)
+        balls = BallBatch(drops)
+        balls.add(x, y, ids=ids)
+        steps = 0
+        start = time.perf_counter()
+        if name == 'numba':
+            bins = backend.run_drops(board, x, y, args.bias, streams, ids=ids)
+            steps = backend.steps
+        else:
+            bins = np.empty(drops, dtype=np.int64)
+            while balls.count:
+                steps += balls.count
+                _, landed_bins, landed_ids, _ = backend.step(balls, board, args.bias, streams)
+                bins[landed_ids] = landed_bins
+        elapsed = time.perf_counter() - start
+        results[name] = bins
+        print(f"{name:9s} {drops:9d} drops {drops / elapsed:12,.0f} drops/s {steps / elapsed:14,.0f} ball-steps/s")
+    shared = min(len(bins) for bins in results.values())
+    same = all(np.array_equal(bins[:shared], results['numpy'][:shared]) for bins in results.values())
+    print("identical bins" if same else "BINS DIFFER between backends")
+
+
+
+if __name__ == '__main__':
+    main()
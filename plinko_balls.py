@@ -3,21 +3,43 @@ v7 full plinko game sounds, betting, animations, and profit/ loss plotting
 Inputs -
     drop ball - click green "Drop" button or click SPACE
     reset board - press R
-    change number of pin rows - click on "Rows" slider to change (no grab and drag)
+    fast-forward falling balls to their bins - press F
+    toggle turbo drops (replay recorded paths, needs the plinko_trajectory.py library) - press T
+    toggle ball-ball collisions - press C (or start with them on with --collisions)
+    change number of pin rows - click on "Rows" slider to change (no grab and drag), taller boards with --max-rows 64
     change number of balls at once - click on "Ball(s) at Once" slider to change (no grab and drag)
     change x-center bias - click on "Center Bias" slider to change (no grab and drag)
+    start every board at its calibrated bias (see plinko_calibrate.py) - run with --calibrated
     change bet - click text input, enter digit only value, hit ENTER (Defaults max bet if value to large) (board must be empty to enter)
 Author - Jared Dilley
 GitHub - https://github.com/jareddilley
 '''
 import sys
 import io
-import random
 import pygame
 import matplotlib.pyplot as plt
 from matplotlib.backends.backend_agg import FigureCanvasAgg as FigureCanvas
+import argparse
 import numpy as np
 import os
+from plinko_physics import Board, BallBatch, drop_start, collide_balls
+from plinko_rng import BallStreams
+from plinko_payout import BIN_TEXTS, payout_vector, text_index, bin_labels, TABLE_ROWS
+from plinko_tables import BinTables
+from plinko_trajectory import TrajectoryLibrary, ReplayBatch, TrajectoryRecorder
+from plinko_calibrate import BiasCalibration
+from plinko_backends import BACKENDS, get_backend
+
+# Command line options
+parser = argparse.ArgumentParser(description="Plinko Game")
+parser.add_argument('--fps', type=int, default=60, help="render frame rate cap, physics speed does not depend on it")
+parser.add_argument('--seed', type=int, default=None, help="session seed, every ball's path is reproducible from it")
+parser.add_argument('--record', default=None, help="record every ball path to this file (see plinko_trajectory.py)")
+parser.add_argument('--backend', choices=('auto',) + BACKENDS, default='auto', help="ball physics backend (auto uses numba when installed)")
+parser.add_argument('--max-rows', type=int, default=16, help="top of the Rows slider, boards past 16 rows are drawn scaled down")
+parser.add_argument('--collisions', action='store_true', help="balls bounce off each other (landing odds no longer match the tables)")
+parser.add_argument('--calibrated', action='store_true', help="use the calibrated bias table for every rows setting")
+args = parser.parse_args()
 
 # Initialize Pygame
 pygame.init()
@@ -39,6 +61,14 @@ pygame.display.set_caption("Plinko Game")
 # Frame counter
 frame_counter = 0
 
+# Timing settings, physics runs in fixed steps no matter how fast frames are drawn
+render_fps = args.fps
+physics_hz = 60
+physics_dt = 1 / physics_hz
+max_frame_time = 0.25  # Skip ahead at most this many seconds after a stall
+clock = pygame.time.Clock()
+accumulator = 0.0
+
 # Pin settings
 pins = []
 pin_radius = int(5 * ratio)
@@ -46,17 +76,31 @@ pin_spacing = int(40 * ratio)
 pin_rows = 16
 pin_start = 0
 
+board = None
+payouts = None
+labels = []  # Multiplier text of every bin
+color_indices = []  # Entry of the bin color gradients for every bin
+view_scale = 1.0  # Boards up to TABLE_ROWS rows are drawn 1:1, taller ones shrink to fit the screen
+bin_font = None  # Font of the bin texts at view_scale
+
+def to_screen(x, y):
+    """Screen position of board position(s), scaled about the top center of the board."""
+    return width // 2 + (x - width // 2) * view_scale, pin_start + (y - pin_start) * view_scale
+
 def create_pins():
     """Creates pins based on current settings."""
+    global board, payouts, labels, color_indices, view_scale, bin_font
+    board = Board(pin_rows, width, pin_spacing, pin_radius, ball_radius, pin_start, fall_speed_increment)
+    payouts = payout_vector(pin_rows)
+    labels = bin_labels(pin_rows)
+    if pin_rows <= TABLE_ROWS: color_indices = [text_index(pin_rows, bin) for bin in range(pin_rows + 1)]
+    else: color_indices = [round(8 + 8 * (bin - pin_rows / 2) / (pin_rows / 2)) for bin in range(pin_rows + 1)]
+    scale = min(1.0, TABLE_ROWS / pin_rows)
+    if bin_font is None or scale != view_scale:
+        bin_font = header2 if scale == 1 else pygame.font.SysFont(font, max(6, int(14 * ratio * scale)), True)
+    view_scale = scale
     pins.clear()
-    offset = pin_spacing // 2
-    for row in range(1, pin_rows + 1):
-        row_offset = offset if row % 2 == 0 else 0
-        for col in range(-(row// 2) - 1, (row - 1) // 2 + 2):
-            x = width // 2 + col * pin_spacing + row_offset
-            y = row * pin_spacing + pin_start
-            pins.append((x, y))
-create_pins()
+    pins.extend(to_screen(pin_x, pin_y) for pin_x, pin_y in board.pins)
 
 # Define colors
 def convert_color(rgb_color):
@@ -112,20 +156,16 @@ rgb_gradient.extend(rgb_gradient_rev[1:])
 dark_rgb_gradient = create_rgb_gradient(dark_red, dark_yellow, (pin_rows+2) // 2)
 dark_rgb_gradient_rev = dark_rgb_gradient[::-1]
 dark_rgb_gradient.extend(dark_rgb_gradient_rev[1:])
-bin_texts = ['1000', '130', '26x', '9x', '4x', '2x', '0.2x', '0.2x', '0.2x','0.2x','0.2x','2x','4x','9x','26x', '130', '1000']
-low_bin_texts = ['1', '1', '1', '9x', '5x', '2x', '1x', '0.5x', '0.2x', '0.5x', '1x', '2x', '5x', '9x', '1', '1', '1']
+bin_texts = BIN_TEXTS
 bin_width = pin_spacing * 0.8
 recent_bins = [bin_texts[7],bin_texts[8],bin_texts[9],bin_texts[10]]
 recent_bin_colors = [rgb_gradient[7],rgb_gradient[8],rgb_gradient[9],rgb_gradient[10]]
 
 def create_bin_text_surfaces():
-    global pin_rows
-    """Pre-render all bin texts."""
+    """Pre-render the text of every bin."""
     bin_text_surfaces = []
-    texts = bin_texts
-    if pin_rows < 10: texts = low_bin_texts
-    for text in texts:
-        rendered_text = header2.render(text, True, black)
+    for text in labels:
+        rendered_text = bin_font.render(text, True, black)
         bin_text_surfaces.append(rendered_text)
     return bin_text_surfaces
 
@@ -135,38 +175,37 @@ hit_bins=[7,8,9,10]
 def render_bins():
     global hit_bins
     bin_text_surfaces = create_bin_text_surfaces()
-    click_offset = 4 * ratio
-    bin_start_offset = width // 2 - (pin_rows // 2 + 0.5) * pin_spacing
-    base_y = pin_rows * pin_spacing + pin_start + pin_spacing // 2
+    click_offset = 4 * ratio * view_scale
+    size = bin_width * view_scale
+    corner = max(1, int((int(4 * ratio) + (ratio > 1)) * view_scale))
+    edges = board.bin_edges()
+    centers_x, base_y = to_screen((edges[:-1] + edges[1:]) / 2, pin_rows * pin_spacing + pin_start + pin_spacing // 2)
     for bin in range(pin_rows + 1):
         animate = True if bin in hit_bins else False # if hit
 
-        offset_x = bin * pin_spacing + (not pin_rows % 2) * pin_spacing // 2
-        index = bin + 8 - pin_rows//2
-        if pin_rows % 2 and bin <= pin_rows//2: index -= 1
-
-        bin_text_surface = bin_text_surfaces[index]
+        index = color_indices[bin]
+        bin_text_surface = bin_text_surfaces[bin]
 
-        base_x = bin_start_offset - bin_width // 2 + offset_x
+        base_x = centers_x[bin] - size // 2
 
         if animate:
             # Configure Rects for drawing  
-            light_rect_right = pygame.Rect(base_x, base_y + click_offset, bin_width, bin_width)
-            text_rect = bin_text_surface.get_rect(center=(base_x + bin_width // 2, base_y + bin_width // 2 + click_offset))
+            light_rect_right = pygame.Rect(base_x, base_y + click_offset, size, size)
+            text_rect = bin_text_surface.get_rect(center=(base_x + size // 2, base_y + size // 2 + click_offset))
 
             # Remove animated bin
             hit_bins = list(filter(lambda x: x != bin, hit_bins))
         else:
             # Configure Rects for drawing  
-            dark_rect_right = pygame.Rect(base_x, base_y + click_offset, bin_width, bin_width)       
-            light_rect_right = pygame.Rect(base_x, base_y, bin_width, bin_width)
-            text_rect = bin_text_surface.get_rect(center=(base_x + bin_width // 2, base_y + bin_width // 2))
+            dark_rect_right = pygame.Rect(base_x, base_y + click_offset, size, size)       
+            light_rect_right = pygame.Rect(base_x, base_y, size, size)
+            text_rect = bin_text_surface.get_rect(center=(base_x + size // 2, base_y + size // 2))
 
             # Draw dark rectangle
-            draw_rounded_rect(screen, dark_rect_right, dark_rgb_gradient[index], int(4 * ratio) + (ratio > 1))            
+            draw_rounded_rect(screen, dark_rect_right, dark_rgb_gradient[index], corner)            
         
         # Draw light rectangle and text
-        draw_rounded_rect(screen, light_rect_right, rgb_gradient[index], int(4 * ratio) + (ratio > 1))
+        draw_rounded_rect(screen, light_rect_right, rgb_gradient[index], corner)
         screen.blit(bin_text_surface, text_rect)
 
 def display_last_bins(recent_bins, recent_bin_colors):
@@ -194,10 +233,16 @@ def display_last_bins(recent_bins, recent_bin_colors):
 
 # Ball settings
 ball_radius = int(9 * ratio) 
-balls = []
+balls = BallBatch()
 del_balls_x = []
 fall_speed_increment = 0.6 * ratio
 balls_at_once = 1
+fast_forward = False
+collisions = args.collisions
+streams = BallStreams(args.seed)  # One random stream per ball for the physics
+physics = get_backend(args.backend)
+rng = np.random.default_rng(args.seed)
+create_pins()
 
 # Set Plot defaults
 plot_update = False
@@ -267,16 +312,13 @@ def custom_hist(data, bins, color_scheme=None, **kwargs):
         for patch, color in zip(patches, color_scheme):
             patch.set_facecolor(color)
 
-def update_prob_plot(del_balls_x):
+def update_prob_plot(del_balls_x, weights=None):
     """Updates the histogram plot of ball locations."""
     fig.set_size_inches(2.2 * ratio, 1.3 * ratio)
     plt.rcParams['axes.edgecolor'] = 'gray'
     bins = np.arange(0, pin_rows + 2, 1)
-    if not pin_rows % 2: plt_gradient_new = plt_gradient[8 - pin_rows//2:]
-    else:
-        plt_gradient_new = plt_gradient[:8] + plt_gradient[9:]
-        plt_gradient_new = plt_gradient_new[8 - pin_rows//2 - 1:]
-    custom_hist(del_balls_x, bins, color_scheme=plt_gradient_new, edgecolor=plt_background)
+    plt_gradient_new = [plt_gradient[index] for index in color_indices]
+    custom_hist(del_balls_x, bins, color_scheme=plt_gradient_new, edgecolor=plt_background, weights=weights)
     # Save to a BytesIO object instead of disk
     buf = io.BytesIO()
     canvas.print_png(buf)
@@ -284,18 +326,56 @@ def update_prob_plot(del_balls_x):
     image = pygame.image.load(buf)
     buf.close()
     return image
-hist_image = update_prob_plot(np.random.normal(8, 2.8, 10000))
+
+# Bin probability tables (built offline with plinko_tables.py)
+bin_tables = BinTables()
+
+# Turbo drops pick the bin first and replay a recorded path (library built with plinko_trajectory.py)
+turbo = False
+trajectory_library = TrajectoryLibrary()
+trajectory_library.load()
+replays = ReplayBatch(trajectory_library, bin_tables)
+
+# Path recording for auditing and replay
+recorder = TrajectoryRecorder(args.record) if args.record else None
+
+def quit_game():
+    """Save the recording and close the game."""
+    if recorder: recorder.close()
+    pygame.quit()
+    sys.exit()
+
+def spawn_ball():
+    """Drop a ball between the top pins, as a replay in turbo mode when the setting has recorded paths."""
+    if turbo and replays.add(pin_rows, bias, rng): return
+    ball_id = balls.next_id
+    start_x, start_y = drop_start(board, 1, streams, [ball_id])
+    balls.add(start_x, start_y, ids=[ball_id])  # x_position, y_position (speeds start at 0)
+
+def expected_prob_plot():
+    """Histogram of the simulated landing distribution, a normal curve if it is not in the tables yet."""
+    probs = bin_tables.lookup(pin_rows, bias)
+    if probs is None: return update_prob_plot(np.random.normal(pin_rows / 2, 0.7 * np.sqrt(pin_rows), 10000))
+    return update_prob_plot(np.arange(pin_rows + 1), weights=probs)
 
 # Slider settings
-bias = 6
+DEFAULT_BIAS = 6
+calibration = BiasCalibration() if args.calibrated else None
+
+def board_bias():
+    """Calibrated bias of the current board, the default bias without a calibration table."""
+    return calibration.bias_for(pin_rows, DEFAULT_BIAS) if calibration else DEFAULT_BIAS
+
+bias = board_bias()
 sliders = {
-    'rows': {'pos': (50 * ratio, 50 * ratio), 'min': 5, 'max': 16, 'value': pin_rows},
+    'rows': {'pos': (50 * ratio, 50 * ratio), 'min': 5, 'max': max(5, args.max_rows), 'value': pin_rows},
     'balls_at_once': {'pos': (50 * ratio, 115 * ratio), 'min': 1, 'max': 50, 'value': balls_at_once},
-    'center_bias': {'pos': (50 * ratio, 180 * ratio), 'min': 1, 'max': 20, 'value': bias},
+    'center_bias': {'pos': (50 * ratio, 180 * ratio), 'min': 1, 'max': 20, 'value': max(1, min(bias, 20))},
 }
 for key, slider in sliders.items():
     slider['rect'] = pygame.Rect(slider['pos'][0], slider['pos'][1], 210 * ratio, 10 * ratio)
     slider['handle'] = pygame.Rect(slider['pos'][0], slider['pos'][1] - 5 * ratio, 10 * ratio, 20 * ratio)
+hist_image = expected_prob_plot()
 
 def handle_sliders(event):
     global plot_update, del_balls_x
@@ -309,11 +389,14 @@ def handle_sliders(event):
                     global pin_rows
                     pin_rows = value
                     create_pins()
+                    if calibration:
+                        global bias
+                        bias = board_bias()
+                        sliders['center_bias']['value'] = max(sliders['center_bias']['min'], min(bias, sliders['center_bias']['max']))
                     del_balls_x.clear()
                     update_prob_plot(del_balls_x)
                     plot_update = True
                 elif key == 'center_bias':
-                    global bias
                     bias = value
                 elif key == 'balls_at_once':
                     global balls_at_once
@@ -329,7 +412,7 @@ def reset_sliders():
             create_pins()
         elif key == 'center_bias':
             global bias
-            slider['value'] = bias
+            slider['value'] = max(slider['min'], min(bias, slider['max']))
         elif key == 'balls_at_once':
             global balls_at_once
             slider['value'] = balls_at_once
@@ -390,7 +473,7 @@ def render_text_box():
 
 def handle_text_input(event):
     global print_error, bet, text, text_active, started_typing, money
-    if event.type == pygame.MOUSEBUTTONDOWN and len(balls) <= 0:
+    if event.type == pygame.MOUSEBUTTONDOWN and len(balls) + len(replays) <= 0:
         # If the user clicked on the input_box rect.
         if input_box.collidepoint(event.pos):
             if not text_active:
@@ -467,12 +550,14 @@ def reset_board():
     create_pins()
     balls_at_once = 1
     ball_radius = int(9 * ratio)
+    if recorder: recorder.remove_balls(balls.ids[:balls.count])
     balls.clear()
+    replays.clear()
     hit_bins.clear()
     del_balls_x.clear()
-    hist_image = update_prob_plot(np.random.normal(8, 2.8, 10000))
     line_image = update_P_L_plot(list(range(0,200)), 15 + np.cumsum(np.random.normal(loc=0.01, scale=5, size=200)))
-    bias = 6
+    bias = board_bias()
+    hist_image = expected_prob_plot()
     reset_sliders()
 
 # Game loop
@@ -483,8 +568,7 @@ while running:
 
     for event in pygame.event.get():
         if event.type == pygame.QUIT:
-            pygame.quit()
-            sys.exit()
+            quit_game()
         elif event.type == pygame.MOUSEBUTTONDOWN:
             if render_button(button_clicked) and not button_clicked:
                 button_clicked = True
@@ -492,29 +576,30 @@ while running:
                     if money - bet < 0: 
                         error_sound.play()
                         break
-                    # Drop a ball between the top pins
-                    start_x = random.randint(width // 2 - pin_spacing + pin_radius, width // 2 + pin_spacing - pin_radius)
-                    balls.append([start_x, random.randint(-2*ball_radius,-ball_radius), 0, 0])  # [x_position, y_position, x_speed, y_speed]
+                    spawn_ball()
                     money -= bet
                 click_sound.play()
         elif event.type == pygame.MOUSEBUTTONUP:
             button_clicked = False
         elif event.type == pygame.KEYDOWN:
             if event.key == pygame.K_ESCAPE:
-                pygame.quit()
-                sys.exit()
+                quit_game()
             elif event.key == pygame.K_SPACE:
                 for idx in range(balls_at_once):
                     if money - bet < 0: 
                         error_sound.play()
                         break
-                    # Drop a ball between the top pins
-                    start_x = random.randint(width // 2 - pin_spacing + pin_radius, width // 2 + pin_spacing - pin_radius)
-                    balls.append([start_x, random.randint(-2*ball_radius,-ball_radius), 0, 0])  # [x_position, y_position, x_speed, y_speed]
+                    spawn_ball()
                     money -= bet
                 click_sound.play()
             elif event.key == pygame.K_r:
                 reset_board()
+            elif event.key == pygame.K_f:
+                fast_forward = True
+            elif event.key == pygame.K_t:
+                turbo = not turbo
+            elif event.key == pygame.K_c:
+                collisions = not collisions
         handle_sliders(event)
         handle_text_input(event)
     frame_counter += 1
@@ -523,82 +608,58 @@ while running:
     render_bins()
     display_last_bins(recent_bins, recent_bin_colors)
 
-    # Update the position of each ball
-    for ball in balls:
-        ball[0] += ball[2]  # Update x position by x speed
-        ball[1] += ball[3]  # Update y position by y speed
-        ball[3] += fall_speed_increment  # Apply gravity to y speed
-
-        # Check for collisions with pins
-        for pin_x, pin_y in pins:
-            dist_sq = (ball[0] - pin_x) ** 2 + (ball[1] - pin_y) ** 2
-            radius_sum = ball_radius + pin_radius
-            if dist_sq < radius_sum ** 2:
-                # Animation
-                pygame.draw.circle(screen, opaque_white, (int(pin_x), int(pin_y)), pin_radius*1.5)
-                
-                # Calulate ball trajectory
-                overlap = radius_sum - np.sqrt(dist_sq)
-                angle = np.arctan2(ball[1] - pin_y, ball[0] - pin_x)
-
-                # Move the ball away from the pin a bit further than the overlap
-                displacement = overlap + 0.5  # Extra 0.5 pixels to ensure it moves out of collision
-                ball[0] += np.cos(angle) * displacement
-                ball[1] += np.sin(angle) * displacement
-
-                # Reflect the velocity and add randomness
-                normal_vector = np.array([np.cos(angle), np.sin(angle)])
-                velocity_vector = np.array([ball[2], ball[3]])
-                reflected_velocity = velocity_vector - 2 * np.dot(velocity_vector, normal_vector) * normal_vector
-                random_factor = 0.5  # Random damping factor
-
-                # Apply randomness and dampening
-                ball[2], ball[3] = reflected_velocity * random_factor
-                ball[2] *= 0.5 # more bouce in the y
-
-                # After calculating the reflected velocity
-                if ball[0] > width / 2 + pin_spacing:
-                    ball[2] -= bias / 20  # Push left if on the right side
-                elif ball[0] < width / 2 - pin_spacing:
-                    ball[2] += bias /20  # Push right if on the left side
-
-                # bias ball toward center
-                bias_list = [-1, 1]
-                direction_change = random.choice(bias_list)                 
-                ball[0] += direction_change
-
-        # Remove the ball at the bottom
-        if ball[1] > (pin_rows+0.5) * pin_spacing + pin_start:
-            ball[1] = height - ball_radius
-            bin = int(((ball[0] - (width // 2) + (not pin_rows%2) * pin_spacing//2) + (pin_spacing * ((pin_rows + 1) // 2))) // pin_spacing)
-            del_balls_x.append(bin)
-            hit_bins.append(bin)
-            balls.remove(ball)
+    # Advance physics in fixed steps for the time the last frame took
+    hit_pins, landed_bins = [], []
+    if fast_forward:
+        # Take every live ball straight to its bin, whole drops in the backend without drawing
+        settled_ids = balls.ids[:balls.count].copy()
+        settled_bins = physics.settle(balls, board, bias, streams)
+        if recorder: recorder.remove_balls(settled_ids, board, bias, settled_bins)
+        landed_bins.extend(settled_bins.tolist())
+        landed_bins.extend(replays.settle().tolist())
+        fast_forward = False
+    while accumulator >= physics_dt:
+        balls.save_previous()
+        step_pins, step_bins, step_ids, step_hits = physics.step(balls, board, bias, streams)
+        if collisions: collide_balls(balls, board)
+        if recorder: recorder.record_step(balls, board, bias, step_pins, step_bins, step_ids, step_hits)
+        hit_pins.extend(step_pins.tolist())
+        landed_bins.extend(step_bins.tolist())
+        landed_bins.extend(replays.step().tolist())
+        accumulator -= physics_dt
+    for pin in hit_pins:
+        # Animation
+        pin_x, pin_y = pins[pin]
+        pygame.draw.circle(screen, opaque_white, (int(pin_x), int(pin_y)), pin_radius*1.5*view_scale)
+
+    # Score the balls that reached the bottom
+    for bin in landed_bins:
+        del_balls_x.append(bin)
+        hit_bins.append(bin)
+        plot_update = True
+        score_sound.play()
+        if 0 <= bin <= pin_rows:
             pl_x_data.append(pl_idx)
-            plot_update = True
-            score_sound.play()
-            if bin < len(bin_texts) and bin >= 0:
-                index = bin + 8 - pin_rows//2
-                if pin_rows % 2 and bin <= pin_rows//2: index -= 1
-                texts = bin_texts
-                if pin_rows < 10: texts = low_bin_texts
-                recent_bins.append(texts[index])
-                recent_bins = recent_bins[-4:]
-                recent_bin_colors.append(rgb_gradient[index])
-                recent_bin_colors = recent_bin_colors[-4:]
-                return_money = bet * float(texts[index].replace('x',''))
-                money += return_money
-                pl_idx += 1
-                pl = pl_y_data[-1] + return_money - bet
-                pl_y_data.append(pl)
+            index = color_indices[bin]
+            recent_bins.append(labels[bin])
+            recent_bins = recent_bins[-4:]
+            recent_bin_colors.append(rgb_gradient[index])
+            recent_bin_colors = recent_bin_colors[-4:]
+            return_money = bet * payouts[bin]
+            money += return_money
+            pl_idx += 1
+            pl = pl_y_data[-1] + return_money - bet
+            pl_y_data.append(pl)
 
     # Draw pins
     for pin_x, pin_y in pins:
-        pygame.draw.circle(screen, white, (int(pin_x), int(pin_y)), pin_radius)
+        pygame.draw.circle(screen, white, (int(pin_x), int(pin_y)), max(1, pin_radius*view_scale))
 
-    # Draw all the balls
-    for ball in balls:
-        pygame.draw.circle(screen, red, (int(ball[0]), int(ball[1])), ball_radius)
+    # Draw all the balls between the last two physics states
+    for ball_x, ball_y in zip(*to_screen(*balls.interpolated(accumulator / physics_dt))):
+        pygame.draw.circle(screen, red, (int(ball_x), int(ball_y)), max(1, ball_radius*view_scale))
+    for ball_x, ball_y in zip(*to_screen(*replays.interpolated(accumulator / physics_dt))):
+        pygame.draw.circle(screen, red, (int(ball_x), int(ball_y)), max(1, ball_radius*view_scale))
 
     # Draw sliders and their labels
     for key, slider in sliders.items():
@@ -628,5 +689,5 @@ while running:
     # Update the display
     pygame.display.flip()
 
-    # Cap the frame rate
-    pygame.time.Clock().tick(60)
+    # Cap the frame rate and bank the elapsed time for physics
+    accumulator += min(clock.tick(render_fps) / 1000, max_frame_time)
@@ -0,0 +1,149 @@
+'''
+Center bias auto-calibration
+Solves for the (continuous) center bias that gives each board a target return-to-player, i.e.
+a house edge of 1 - target. Every candidate bias is simulated with the same ball streams (common
+random numbers), so the estimated RTP curve moves smoothly with the bias and the bisection is not
+thrown around by sampling noise between candidates.
+The result is a small JSON table that the game loads at startup with --calibrated.
+Usage -
+    python plinko_calibrate.py --target 0.97 --drops 100000
+    python plinko_calibrate.py --target 0.99 --rows 16 --drops 400000 --seed 3
+    python plinko_calibrate.py --target 0.97 --precision 0.001   (check every result to +-0.1% RTP)
+'''
+import argparse
+import json
+import os
+import numpy as np
+from plinko_physics import physics_fingerprint
+from plinko_payout import payout_vector, rtp_stats
+from plinko_sim import simulate_configs, simulate_sequential, run_seed
+from plinko_tables import ROWS_RANGE, DEFAULT_DROPS
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'bias_calibration.json')
+BIAS_LOW = 0.0
+BIAS_HIGH = 40.0
+COARSE_POINTS = 17  # Evenly spaced biases scanned for the first crossing of the target
+ITERATIONS = 8  # Bisection steps after the scan, each halves the bracket
+
+
+def rtp_estimate(counts, drops, payouts):
+    """Mean multiplier of drops balls with bin counts, and its standard error."""
+    stats = rtp_stats(counts / drops, payouts)
+    return float(stats['rtp']), float(stats['std'] / np.sqrt(drops))
+
+
+def calibrate(target, rows_range=ROWS_RANGE, drops=DEFAULT_DROPS, seed=None, workers=None,
+              bias_low=BIAS_LOW, bias_high=BIAS_HIGH, coarse_points=COARSE_POINTS, iterations=ITERATIONS, precision=None):
+    """Bias giving RTP target (a number, or a dict by pin_rows) for every board in rows_range.
+    The RTP falls as the bias grows but not strictly, so the lowest bias bracket where it crosses the
+    target is bisected, with all boards evaluated together in one process pool per step.
+    With precision, the RTP of every chosen bias is then measured with simulate_sequential() until its
+    95% interval is +-precision wide (at least drops drops) instead of from drops drops.
+    Returns {pin_rows: {'bias', 'target', 'rtp', 'stderr', 'drops', 'bracketed'}}, bracketed is False when
+    no bias in [bias_low, bias_high] reaches the target and the closest scanned bias was taken instead."""
+    seed = run_seed(seed)  # Shared by every candidate, that is what makes the numbers common
+    targets = target if isinstance(target, dict) else {rows: target for rows in rows_range}
+    payouts = {rows: payout_vector(rows) for rows in rows_range}
+
+    def excess(configs):
+        """RTP above target of every (pin_rows, bias) in configs."""
+        counts = simulate_configs(drops, configs, seed, workers)
+        return [rtp_estimate(c, drops, payouts[rows])[0] - targets[rows] for (rows, _), c in zip(configs, counts)]
+
+    coarse = np.linspace(bias_low, bias_high, coarse_points)
+    configs = [(rows, float(bias)) for rows in rows_range for bias in coarse]
+    scanned = np.array(excess(configs)).reshape(len(rows_range), coarse_points)
+
+    biases, brackets = {}, {}  # brackets[rows] = [low bias, high bias, excess at low, excess at high]
+    for i, rows in enumerate(rows_range):
+        crossed = np.flatnonzero(scanned[i] <= 0)
+        if len(crossed) and crossed[0] > 0:
+            j = crossed[0]
+            brackets[rows] = [coarse[j - 1], coarse[j], scanned[i, j - 1], scanned[i, j]]
+        else:
+            biases[rows] = float(coarse[np.argmin(np.abs(scanned[i]))])
+
+    for _ in range(iterations):
+        if not brackets: break
+        mids = [(rows, (low + high) / 2) for rows, (low, high, _, _) in brackets.items()]
+        for (rows, mid), value in zip(mids, excess(mids)):
+            bracket = brackets[rows]
+            if value > 0: bracket[0], bracket[2] = mid, value
+            else: bracket[1], bracket[3] = mid, value
+    for rows, (low, high, above, below) in brackets.items():
+        # With common random numbers the RTP is a step function of the bias, so take the closer end
+        biases[rows] = float(low if abs(above) <= abs(below) else high)
+
+    final = [(rows, biases[rows]) for rows in rows_range]
+    if precision:
+        runs = [simulate_sequential(payouts[rows], precision, rows, bias, seed, workers, min_drops=drops) for rows, bias in final]
+        measured = [(run['counts'], run['drops']) for run in runs]
+    else:
+        measured = [(counts, drops) for counts in simulate_configs(drops, final, seed, workers)]
+    results = {}
+    for (rows, bias), (counts, used) in zip(final, measured):
+        rtp, stderr = rtp_estimate(counts, used, payouts[rows])
+        results[rows] = {'bias': bias, 'target': targets[rows], 'rtp': rtp, 'stderr': stderr, 'drops': used,
+                         'bracketed': rows in brackets}
+    return results
+
+
+class BiasCalibration:
+    """Calibrated bias per pin_rows, read from the JSON table written by calibrate runs."""
+
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = path
+        self.fingerprint = physics_fingerprint()
+        self.entries = {}
+        if not os.path.exists(path): return
+        with open(path) as file:
+            data = json.load(file)
+        if data.get('fingerprint') != self.fingerprint: return  # Stale, physics changed
+        self.entries = {int(rows): entry for rows, entry in data['rows'].items()}
+
+    def bias_for(self, pin_rows, default=None):
+        """Calibrated bias of a board, default if it has not been calibrated."""
+        entry = self.entries.get(pin_rows)
+        return default if entry is None else entry['bias']
+
+    def update(self, results, drops, seed):
+        """Merge calibrate() results into the table (call save() to persist)."""
+        for rows, entry in results.items():
+            self.entries[rows] = dict(entry, drops=entry.get('drops', drops), seed=seed)
+
+    def save(self):
+        """Write the table atomically next to the old file."""
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as file:
+            json.dump({'fingerprint': self.fingerprint,
+                       'rows': {str(rows): self.entries[rows] for rows in sorted(self.entries)}}, file, indent=1)
+        os.replace(tmp_path, self.path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Solve for the center bias that gives a target RTP")
+    parser.add_argument('--target', type=float, default=0.97, help="target RTP (1 - house edge)")
+    parser.add_argument('--rows', type=int, nargs='*', default=None, help="boards to calibrate (default every slider setting)")
+    parser.add_argument('--drops', type=int, default=DEFAULT_DROPS, help="drops per candidate bias")
+    parser.add_argument('--seed', type=int, default=None, help="seed for a reproducible calibration")
+    parser.add_argument('--workers', type=int, default=None, help="worker processes (default all cores)")
+    parser.add_argument('--precision', type=float, default=None, help="measure every result until its 95%% RTP interval is this narrow (0.001 for +-0.1%%)")
+    parser.add_argument('--path', default=DEFAULT_PATH, help="calibration table file")
+    args = parser.parse_args()
+
+    rows_range = args.rows or list(ROWS_RANGE)
+    seed = run_seed(args.seed)
+    results = calibrate(args.target, rows_range, args.drops, seed, args.workers, precision=args.precision)
+    print("rows    bias    RTP %   +- %       drops")
+    for rows, entry in results.items():
+        note = '' if entry['bracketed'] else '  (target out of reach)'
+        print(f"{rows:4d} {entry['bias']:7.3f} {100 * entry['rtp']:8.2f} {100 * entry['stderr']:6.2f} {entry['drops']:11,d}{note}")
+    table = BiasCalibration(args.path)
+    table.update(results, args.drops, seed)
+    table.save()
+    print(f"Saved {args.path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,241 @@
+'''
+Simulation work queue over sockets, for sweeps bigger than one machine's process pool
+A coordinator splits a (rows, bias) sweep into work units - one chunk of ball ids of one
+configuration - and hands them to workers over TCP. Workers simulate the unit with
+plinko_sim.simulate_chunk() and send the bin counts back. Every configuration uses the same ball
+streams (common random numbers, like simulate_grid()), so a unit's counts only depend on the unit:
+  - a unit whose worker went quiet is handed out again after its lease runs out, and if both
+    copies come back the second is ignored, so nothing is counted twice
+  - finished units are appended to a state file, so a restarted coordinator carries on where it
+    stopped and workers simply reconnect
+  - the result is summed in unit order and equals simulate_grid() for the same seed
+The protocol is one JSON line each way per connection:
+    {"op": "get", "worker": name}           -> {"unit": [rows, bias, first_id, n], "seed", "mode", "fingerprint"},
+                                               {"wait": seconds} or {"done": true}
+    {"op": "put", "unit": [...], "counts"}  -> {"ok": true}
+Usage -
+    python plinko_cluster.py coordinate --rows 8 12 16 --bias 4 6 8 --drops 1000000 --seed 7 --state sweep.jsonl
+    python plinko_cluster.py work --host 10.0.0.5          (on every machine, as many as it has cores)
+    python plinko_cluster.py local --workers 4 --rows 12 16 --bias 6 --drops 200000   (all on this machine)
+'''
+import argparse
+import json
+import os
+import socket
+import socketserver
+import subprocess
+import sys
+import threading
+import time
+import numpy as np
+from plinko_physics import physics_fingerprint
+from plinko_sim import CHUNK_SIZE, MODES, simulate_chunk, split_drops, run_seed
+
+PORT = 5557
+LEASE_SECONDS = 300  # A unit not reported back within this is handed out again
+WAIT_SECONDS = 1.0  # Asked of workers while every unit left is leased
+RETRY_SECONDS = 2.0  # Between a worker's attempts to reach the coordinator
+
+
+class Sweep:
+    """Work units of a sweep and the counts that came back, optionally kept in a state file.
+    A sweep resumed from its state file keeps the seed it was started with, seed only has to match it when given."""
+
+    def __init__(self, configs, drops, seed=None, mode='batch', chunk_size=CHUNK_SIZE, state_path=None,
+                 lease_seconds=LEASE_SECONDS):
+        self.configs = [(int(rows), float(bias)) for rows, bias in configs]
+        self.drops = drops
+        self.seed = run_seed(seed)
+        self.mode = mode
+        self.lease_seconds = lease_seconds
+        self.units = [(rows, bias, first_id, n) for rows, bias in self.configs for first_id, n in split_drops(drops, chunk_size)]
+        self.unit_set = set(self.units)
+        self.done = {}  # unit -> counts
+        self.leases = {}  # unit -> time it was handed out
+        self.lock = threading.Lock()
+        self.state_path = state_path
+        self.header = {'configs': self.configs, 'drops': drops, 'seed': self.seed, 'mode': mode,
+                       'chunk_size': chunk_size, 'fingerprint': physics_fingerprint()}
+        if state_path: self._resume(seed)
+
+    def _resume(self, seed):
+        """Load the seed and the units finished before a restart, or start the state file."""
+        if not os.path.exists(self.state_path) or os.path.getsize(self.state_path) == 0:
+            with open(self.state_path, 'w') as file:
+                file.write(json.dumps(self.header) + '\n')
+            return
+        with open(self.state_path, 'rb+') as file:
+            header = json.loads(file.readline())
+            expected = json.loads(json.dumps(self.header))
+            if any(header.get(key) != expected[key] for key in expected if key != 'seed'):
+                raise ValueError(f"{self.state_path} belongs to another sweep (or other physics), use a new state file")
+            if seed is not None and header['seed'] != self.seed:
+                raise ValueError(f"{self.state_path} was started with seed {header['seed']}, not {seed}")
+            self.seed = self.header['seed'] = header['seed']
+            for line in iter(file.readline, b''):
+                if not line.endswith(b'\n'):  # Cut off by a crash while writing
+                    file.truncate(file.tell() - len(line))
+                    break
+                entry = json.loads(line)
+                self.done[tuple(entry['unit'])] = np.array(entry['counts'], dtype=np.int64)
+
+    def next_unit(self):
+        """A unit nobody is working on, the oldest expired lease, or None when every unit is leased or done."""
+        with self.lock:
+            now = time.monotonic()
+            for unit in self.units:
+                if unit in self.done: continue
+                leased = self.leases.get(unit)
+                if leased is None or now - leased > self.lease_seconds:
+                    self.leases[unit] = now
+                    return unit
+            return None
+
+    def finish(self, unit, counts):
+        """Store a unit's counts. A unit that is already done is ignored (a lease that ran out but
+        still came back), its counts are the same anyway. Units leased before a restart are taken."""
+        unit = (int(unit[0]), float(unit[1]), int(unit[2]), int(unit[3]))
+        with self.lock:
+            if unit in self.done or unit not in self.unit_set: return
+            self.done[unit] = np.asarray(counts, dtype=np.int64)
+            self.leases.pop(unit, None)
+            if self.state_path:
+                with open(self.state_path, 'a') as file:
+                    file.write(json.dumps({'unit': unit, 'counts': self.done[unit].tolist()}) + '\n')
+
+    @property
+    def complete(self):
+        return len(self.done) == len(self.units)
+
+    def counts(self):
+        """Bin counts of every configuration, summed in unit order."""
+        totals = {config: np.zeros(config[0] + 1, dtype=np.int64) for config in self.configs}
+        for unit in self.units:
+            if unit in self.done: totals[unit[:2]] += self.done[unit]
+        return [totals[config] for config in self.configs]
+
+
+class CoordinatorHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        sweep = self.server.sweep
+        request = json.loads(self.rfile.readline())
+        if request['op'] == 'get':
+            unit = sweep.next_unit()
+            if unit is not None: reply = {'unit': unit, 'seed': sweep.seed, 'mode': sweep.mode, 'fingerprint': sweep.header['fingerprint']}
+            elif sweep.complete: reply = {'done': True}
+            else: reply = {'wait': WAIT_SECONDS}
+        elif request['op'] == 'put':
+            sweep.finish(request['unit'], request['counts'])
+            reply = {'ok': True}
+            if sweep.complete: self.server.finished.set()
+        else:
+            reply = {'error': f"unknown op {request['op']!r}"}
+        self.wfile.write((json.dumps(reply) + '\n').encode())
+
+
+class Coordinator(socketserver.ThreadingTCPServer):
+    """TCP server handing out the units of a sweep, serve() returns once every unit is done."""
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, sweep, host='', port=PORT):
+        super().__init__((host, port), CoordinatorHandler)
+        self.sweep = sweep
+        self.finished = threading.Event()
+        if sweep.complete: self.finished.set()
+
+    def serve(self, linger=2 * WAIT_SECONDS):
+        """Serve until the sweep is complete, then a little longer so waiting workers hear it is done."""
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        self.finished.wait()
+        time.sleep(linger)
+        self.shutdown()
+        self.server_close()
+
+
+def request(host, port, message, timeout=60):
+    """Send one JSON message to the coordinator and return its reply."""
+    with socket.create_connection((host, port), timeout=timeout) as connection:
+        connection.sendall((json.dumps(message) + '\n').encode())
+        return json.loads(connection.makefile().readline())
+
+
+def work(host='localhost', port=PORT, name=None, give_up=None):
+    """Worker loop: fetch a unit, simulate it, send the counts, until the coordinator says done.
+    Connection failures and cut off replies are retried every RETRY_SECONDS (the coordinator may be
+    restarting), for at most give_up seconds in a row when that is set. Returns the number of units done.
+    Raises RuntimeError when the coordinator runs other physics (see physics_fingerprint())."""
+    name = name or f"{socket.gethostname()}:{os.getpid()}"
+    units = 0
+    failing_since = None
+    while True:
+        try:
+            reply = request(host, port, {'op': 'get', 'worker': name})
+            if reply.get('done'): return units
+            if 'wait' in reply:
+                time.sleep(reply['wait'])
+                continue
+            if reply['fingerprint'] != physics_fingerprint():
+                raise RuntimeError(f"Coordinator physics {reply['fingerprint']} differs from this worker's {physics_fingerprint()}")
+            rows, bias, first_id, n = reply['unit']
+            counts = simulate_chunk(rows, bias, first_id, n, reply['seed'], reply['mode'])
+            request(host, port, {'op': 'put', 'worker': name, 'unit': reply['unit'], 'counts': counts.tolist()})
+            units += 1
+            failing_since = None
+        except (OSError, ValueError, KeyError):  # ValueError covers half a JSON line, KeyError half a reply
+            if failing_since is None: failing_since = time.monotonic()
+            if give_up is not None and time.monotonic() - failing_since > give_up: return units
+            time.sleep(RETRY_SECONDS)
+
+
+def report(sweep):
+    for (rows, bias), counts in zip(sweep.configs, sweep.counts()):
+        probs = counts / sweep.drops
+        print(f"rows={rows:2d} bias={bias:g}: " + ' '.join(f"{prob:.4f}" for prob in probs))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Coordinator and workers for drop simulation sweeps over TCP")
+    parser.add_argument('role', choices=('coordinate', 'work', 'local'), help="run the coordinator, a worker, or both on this machine")
+    parser.add_argument('--host', default='localhost', help="coordinator address (workers)")
+    parser.add_argument('--port', type=int, default=PORT, help="coordinator port")
+    parser.add_argument('--rows', type=int, nargs='+', default=[16], help="pin rows of the sweep")
+    parser.add_argument('--bias', type=float, nargs='+', default=[6], help="center biases of the sweep")
+    parser.add_argument('--drops', type=int, default=100000, help="drops per configuration")
+    parser.add_argument('--seed', type=int, default=None, help="seed for a reproducible sweep (a resumed sweep keeps its own)")
+    parser.add_argument('--mode', choices=MODES, default='batch', help="simulation mode, see plinko_sim.py")
+    parser.add_argument('--state', default=None, help="file keeping finished units, to resume after a coordinator restart")
+    parser.add_argument('--out', default=None, help="write the bin counts to this .npz file")
+    parser.add_argument('--workers', type=int, default=None, help="worker processes for local (default all cores)")
+    parser.add_argument('--lease', type=float, default=LEASE_SECONDS, help="seconds before a unit that has not come back is handed out again")
+    parser.add_argument('--give-up', type=float, default=None, help="seconds a worker keeps trying to reach a coordinator that is gone (default forever)")
+    args = parser.parse_args()
+
+    if args.role == 'work':
+        print(f"{work(args.host, args.port, give_up=args.give_up)} units done")
+        return
+
+    sweep = Sweep([(rows, bias) for rows in args.rows for bias in args.bias], args.drops, args.seed, args.mode,
+                  state_path=args.state, lease_seconds=args.lease)
+    print(f"{len(sweep.units)} units, {len(sweep.done)} already done, serving on port {args.port}")
+    coordinator = Coordinator(sweep, port=args.port)
+    workers = []
+    if args.role == 'local':
+        command = [sys.executable, os.path.abspath(__file__), 'work', '--host', 'localhost', '--port', str(args.port),
+                   '--give-up', str(args.give_up or 10 * RETRY_SECONDS)]
+        workers = [subprocess.Popen(command) for _ in range(args.workers or os.cpu_count())]
+    start = time.perf_counter()
+    coordinator.serve()
+    for worker in workers: worker.wait()
+    elapsed = time.perf_counter() - start
+    report(sweep)
+    print(f"{len(sweep.configs) * sweep.drops:,d} drops in {elapsed:.1f}s")
+    if args.out:
+        np.savez_compressed(args.out, configs=np.array(sweep.configs), drops=sweep.drops,
+                            counts=np.array([np.pad(counts, (0, max(args.rows) + 1 - len(counts))) for counts in sweep.counts()]))
+        print(f"Saved {args.out}")
+
+
+if __name__ == '__main__':
+    main()
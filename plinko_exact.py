@@ -0,0 +1,139 @@
+'''
+Exact landing distribution by probability propagation through the pin lattice
+Takes the per-pin transition probabilities of a Markov surrogate (pin, entry velocity bucket ->
+next pin or bin, see plinko_surrogate.py) and solves for the expected visits of every state row by
+row. The states of one pin row form a block: the loops a ball makes inside the row are solved with
+the row's (I - Q)^-1, and the small share of balls that bounce back up a row is folded into the
+rows above by block elimination, bottom row first. What is left is one pass of small
+vector-matrix products up the board and one down, so payouts can be tuned interactively.
+MarkovSurrogate.distribution() is this solver.
+Usage -
+    python plinko_exact.py --rows 16 --bias 6 --train 200000
+    python plinko_exact.py --load data/surrogate_16_6.npz --rows 16
+'''
+import argparse
+import time
+import numpy as np
+from plinko_physics import Board
+from plinko_surrogate import MarkovSurrogate, BUCKETS
+from plinko_payout import payout_vector, rtp_stats
+
+
+class LatticePropagator:
+    """A surrogate's transitions cut into blocks by pin row and eliminated bottom-up.
+    The visits v_r of the states of row r satisfy v_r (I - Q_rr) = entry_r + sum over s != r of v_s Q_sr.
+    Eliminating the rows from the bottom leaves for every row its solve = (I - Q_rr)^-1 (with what
+    flows back up from below folded in) and couplings[r] = {s: block} to rows s above it only, and
+    folds, the steps that carry the entry vector up along the eliminations."""
+
+    def __init__(self, surrogate):
+        self.num_bins = surrogate.num_bins
+        start = surrogate.start
+        sources, targets, probs = surrogate.sources, surrogate.targets, surrogate.probs
+
+        # Number the states with outgoing transitions row by row
+        states = np.unique(sources[sources < start])
+        state_rows = surrogate.pin_rows[states // BUCKETS]
+        self.rows = np.unique(state_rows).tolist()
+        local = np.full(start + 1, -1, dtype=np.int64)
+        sizes = {}
+        for row in self.rows:
+            members = states[state_rows == row]
+            local[members] = np.arange(len(members))
+            sizes[row] = len(members)
+        row_of = np.full(start + 1, 0, dtype=np.int64)
+        row_of[states] = state_rows
+
+        # Transition blocks between rows, exits to the bins (last column: off the board)
+        inner = (sources < start) & (targets < start) & (local[np.minimum(targets, start)] >= 0)
+        done = targets > start
+        diagonal, couplings, self.exits = {}, {row: {} for row in self.rows}, {}
+        for row in self.rows:
+            from_row = (row_of[sources] == row) & (sources < start)
+            diagonal[row] = np.eye(sizes[row])
+            pairs = from_row & inner
+            for other in np.unique(row_of[targets[pairs]]).tolist():
+                block = np.zeros((sizes[row], sizes[other]))
+                chosen = pairs & (row_of[np.minimum(targets, start)] == other)
+                np.add.at(block, (local[sources[chosen]], local[targets[chosen]]), probs[chosen])
+                if other == row: diagonal[row] -= block
+                else: couplings[other][row] = block
+            exits = np.zeros((sizes[row], self.num_bins + 1))
+            chosen = from_row & done
+            np.add.at(exits, (local[sources[chosen]], targets[chosen] - start - 1), probs[chosen])
+            self.exits[row] = exits
+
+        # Where dropped balls make their first contact
+        self.entry = {row: np.zeros(sizes[row]) for row in self.rows}
+        self.entry_exits = np.zeros(self.num_bins + 1)
+        first = (sources == start) & (local[np.minimum(targets, start)] >= 0) & (targets < start)
+        for target, prob in zip(targets[first].tolist(), probs[first].tolist()):
+            self.entry[int(row_of[target])][local[target]] += prob
+        direct = (sources == start) & (targets > start)
+        np.add.at(self.entry_exits, targets[direct] - start - 1, probs[direct])
+
+        # Block elimination, bottom row first: v_row = (entry_row + sum v_s couplings[row][s]) solve[row]
+        # is put into every row still left that row flows into
+        self.solve, self.folds = {}, []
+        for row in reversed(self.rows):
+            solve = np.linalg.inv(diagonal[row])
+            self.solve[row] = solve
+            for target in self.rows:
+                if target >= row or row not in couplings[target]: continue
+                fold = solve @ couplings[target].pop(row)
+                self.folds.append((row, target, fold))
+                for other, block in couplings[row].items():
+                    if other == target: diagonal[target] -= block @ fold
+                    elif other in couplings[target]: couplings[target][other] += block @ fold
+                    else: couplings[target][other] = block @ fold
+        self.couplings = couplings
+
+    def distribution(self):
+        """Landing probability of every bin (length num_bins), the rest misses every bin."""
+        carried = {row: vector.copy() for row, vector in self.entry.items()}
+        for row, target, fold in self.folds:
+            carried[target] += carried[row] @ fold
+        landed = self.entry_exits.copy()
+        visits = {}
+        for row in self.rows:
+            incoming = carried[row]
+            for other, block in self.couplings[row].items():
+                incoming = incoming + visits[other] @ block
+            visits[row] = incoming @ self.solve[row]  # Expected visits of every state of the row
+            landed += visits[row] @ self.exits[row]
+        return landed[:self.num_bins]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Exact landing distribution by propagating probabilities through the board")
+    parser.add_argument('--rows', type=int, default=16, help="number of pin rows")
+    parser.add_argument('--bias', type=float, default=6, help="center bias (slider value)")
+    parser.add_argument('--train', type=int, default=200000, help="physics drops to learn the transitions from")
+    parser.add_argument('--seed', type=int, default=None, help="training seed")
+    parser.add_argument('--load', default=None, help="use a surrogate saved by plinko_surrogate.py --save instead of training")
+    args = parser.parse_args()
+
+    board = Board(args.rows)
+    surrogate = MarkovSurrogate.load(args.load) if args.load else None
+    if surrogate is None:
+        if args.load: print(f"{args.load} was made with other physics or an older version, training a new surrogate")
+        surrogate = MarkovSurrogate.fit(board, args.bias, args.train, args.seed)
+    start = time.perf_counter()
+    propagator = LatticePropagator(surrogate)
+    setup = time.perf_counter() - start
+    start = time.perf_counter()
+    probs = propagator.distribution()
+    elapsed = time.perf_counter() - start
+
+    payouts = payout_vector(args.rows)
+    stats = rtp_stats(probs, payouts)
+    print(" bin  probability  multiplier")
+    for bin, (prob, payout) in enumerate(zip(probs, payouts)):
+        print(f"{bin:4d} {prob:12.6f} {payout:11g}")
+    print(f"RTP {100 * stats['rtp']:.3f}%  std {stats['std']:.3f}  hit frequency {100 * stats['hit_frequency']:.2f}%")
+    print(f"missing mass {1 - probs.sum():.2e}")
+    print(f"setup {1000 * setup:.1f} ms, each evaluation {1000 * elapsed:.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,188 @@
+'''
+Importance splitting for the rare edge bins
+The outer bins (1000x and 130x) are hit by about one ball in a thousand on 16 rows and by one in
+several hundred thousand on 32, so plain Monte Carlo needs a very large number of drops to pin them
+down. Balls only reach those bins by riding the outer pins of the pyramid all the way down, so:
+    splitting - a ball still in the outer lane when it gets past the next depth level becomes SPLIT
+                balls, each going on from the same position and speed with its own fresh random
+                stream and 1 / SPLIT of the weight
+    roulette  - a ball that has left the lane (and almost never comes back) goes on one time in
+                ROULETTE with ROULETTE times the weight, so the bulk of the balls costs less
+The weights are the likelihood ratios of these choices, so the weighted bin counts are unbiased for
+every bin. Every dropped ball with all its clones is one independent sample, which gives the
+standard errors and confidence intervals. The edge bins get far more hits for the work while the
+middle bins get noisier, the estimate is meant for the tails.
+Measured in ball-steps for the same error as plain drops, edge bins: about 6x on 16 rows, 60x on
+24 and more than 100x on 32. Wall time gains less (10x on 24 rows), the balls are stepped a frame at
+a time with Python bookkeeping in between instead of whole drops in the kernel. Below 16 rows the
+edges are not rare and splitting does not pay.
+Tilting the -1/+1 nudges or the start x towards the edges does not work: the nudges only steer
+through chaotic bounces, so even a 0.8/0.2 tilt only doubles the edge hits while the likelihood
+ratios of 30 or more nudges blow the variance up.
+Usage -
+    python plinko_importance.py --rows 16 --bias 6 --drops 50000
+    python plinko_importance.py --rows 32 --drops 20000 --split 3 --levels 0.25 0.5 0.75
+'''
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from plinko_physics import Board, BallBatch, drop_start
+from plinko_rng import BallStreams
+from plinko_backends import get_backend
+from plinko_sim import CHUNK_SIZE, run_seed, simulate_drops, split_drops
+from plinko_payout import payout_vector
+
+LEVELS = (0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8)  # Splitting depths on the outer lane, as fractions of the pin rows
+SPLIT = 2  # Balls a ball becomes at every level
+LANE = 2  # Width of the outer lane in pin spacings
+ROULETTE = 16  # Balls that leave the lane below ROULETTE_DEPTH go on one time in ROULETTE, weighing ROULETTE times more
+ROULETTE_DEPTH = 0.25
+CLONE_BASE = 1 << 62  # Stream ids of clones: CLONE_BASE + root * MAX_CLONES + k, apart from every dropped ball
+MAX_CLONES = 1 << 20  # Clones one dropped ball may have
+MAX_FRAMES = 10000
+Z_95 = 1.959964
+
+
+class SplitBatch(BallBatch):
+    """BallBatch that also keeps every ball's weight, splitting level, the dropped ball it descends
+    from and whether it has been through roulette."""
+    fields = BallBatch.fields + ('weight', 'level', 'root', 'culled')
+    counters = BallBatch.counters + ('level', 'root', 'culled')
+
+
+def edge_score(board, x, y):
+    """How far down the board balls got while still in the outer lane of the pyramid, as a fraction of
+    its rows (-1 off the lane). Balls only reach an edge bin by riding the outermost pins all the way
+    down, and one still on the lane becomes about twice as likely to get there every two rows."""
+    depth = (y - board.pin_start) / board.pin_spacing
+    outer = np.abs(x - board.center_x) / board.pin_spacing >= depth / 2 - LANE
+    return np.where(outer, depth / board.pin_rows, -1.0)
+
+
+def split_chunk(pin_rows, bias, first_id, n, seed, levels=LEVELS, split=SPLIT, roulette=ROULETTE, max_frames=MAX_FRAMES):
+    """Drop balls first_id .. first_id + n - 1 with splitting and roulette.
+    Returns (sum, sum of squares) over the dropped balls of their weighted bin counts (num_bins each)
+    and the ball-steps taken. The clones of a ball only depend on the ball, not on the chunk."""
+    board = Board(pin_rows)
+    streams = BallStreams(seed)
+    physics = get_backend('auto')
+    ids = np.arange(first_id, first_id + n)
+    x, y = drop_start(board, n, streams, ids)
+    balls = SplitBatch(n)
+    balls.add(x, y, ids=ids)
+    balls.weight[:n] = 1.0
+    balls.level[:n] = 0
+    balls.root[:n] = ids - first_id
+    balls.culled[:n] = 0
+    roulette_y = board.pin_start + ROULETTE_DEPTH * pin_rows * board.pin_spacing
+    clones = np.zeros(n, dtype=np.int64)
+    weighted = np.zeros((n, board.num_bins))
+    steps = 0
+    for _ in range(max_frames):
+        count = balls.count
+        if count == 0: break
+        steps += count
+        live_ids, live_weight, live_root = balls.ids[:count].copy(), balls.weight[:count].copy(), balls.root[:count].copy()
+        _, bins, landed_ids, _ = physics.step(balls, board, bias, streams)
+        if len(landed_ids):
+            sorter = np.argsort(live_ids)
+            slot = sorter[np.searchsorted(live_ids, landed_ids, sorter=sorter)]
+            valid = (bins >= 0) & (bins < board.num_bins)
+            np.add.at(weighted, (live_root[slot[valid]], bins[valid]), live_weight[slot[valid]])
+        count = balls.count
+        score = edge_score(board, balls.x[:count], balls.y[:count])
+
+        # Roulette for balls off the lane: one in roulette goes on with roulette times the weight
+        if roulette > 1:
+            culled = np.flatnonzero((score < 0) & (balls.y[:count] > roulette_y) & (balls.culled[:count] == 0))
+            if len(culled):
+                u = streams.random(balls.ids[culled], balls.draws[culled])
+                balls.draws[culled] += 1
+                balls.culled[culled] = 1
+                balls.weight[culled] *= roulette
+                if (u >= 1 / roulette).any():
+                    balls.remove(np.isin(np.arange(count), culled[u >= 1 / roulette]))
+                    count = balls.count
+                    score = edge_score(board, balls.x[:count], balls.y[:count])
+
+        # Split the balls that went past their next level, clones of one ball in id order
+        reached = np.searchsorted(levels, score, side='right')
+        crossed = np.flatnonzero(reached > balls.level[:count])
+        if len(crossed) == 0: continue
+        crossed = crossed[np.argsort(balls.ids[crossed])]
+        jumps = reached[crossed] - balls.level[crossed]
+        balls.level[crossed] = reached[crossed]
+        balls.weight[crossed] /= split ** jumps
+        copies = np.repeat(crossed, split ** jumps - 1)
+        if len(copies) == 0: continue
+        roots = balls.root[copies]
+        order = np.argsort(roots, kind='stable')
+        rank = np.empty(len(copies), dtype=np.int64)
+        rank[order] = np.arange(len(copies)) - np.searchsorted(roots[order], roots[order], side='left')
+        k = clones[roots] + rank
+        if k.max() >= MAX_CLONES: raise RuntimeError(f"More than {MAX_CLONES} clones of one ball, use fewer levels or a smaller split")
+        clones += np.bincount(roots, minlength=n)
+        start = balls.count
+        balls.add(balls.x[copies], balls.y[copies], balls.vx[copies], balls.vy[copies],
+                  ids=CLONE_BASE + (roots + first_id) * MAX_CLONES + k)
+        for name in ('prev_x', 'prev_y', 'draws', 'contacts', 'slow', 'weight', 'level', 'root', 'culled'):
+            getattr(balls, name)[start:balls.count] = getattr(balls, name)[copies]
+    return weighted.sum(axis=0), (weighted ** 2).sum(axis=0), steps
+
+
+def split_estimate(drops, pin_rows=16, bias=6, seed=None, workers=None, levels=LEVELS, split=SPLIT, roulette=ROULETTE,
+                   chunk_size=CHUNK_SIZE):
+    """Bin probabilities of drops dropped balls estimated with splitting.
+    Returns a dict of arrays over the bins: probs, stderr and low / high (95% confidence interval,
+    normal approximation), and steps, the ball-steps simulated."""
+    seed = run_seed(seed)
+    chunks = split_drops(drops, chunk_size)
+    if workers == 1 or len(chunks) <= 1:
+        parts = [split_chunk(pin_rows, bias, first_id, n, seed, levels, split, roulette) for first_id, n in chunks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+            futures = [pool.submit(split_chunk, pin_rows, bias, first_id, n, seed, levels, split, roulette) for first_id, n in chunks]
+            parts = [future.result() for future in futures]
+    total = sum(part[0] for part in parts)
+    squares = sum(part[1] for part in parts)
+    probs = total / drops
+    stderr = np.sqrt(np.maximum(squares / drops - probs ** 2, 0) / (drops - 1))
+    return {'probs': probs, 'stderr': stderr, 'low': probs - Z_95 * stderr, 'high': probs + Z_95 * stderr,
+            'steps': sum(part[2] for part in parts)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Edge bin probabilities by splitting and roulette, compared with plain drops")
+    parser.add_argument('--rows', type=int, default=16, help="number of pin rows")
+    parser.add_argument('--bias', type=float, default=6, help="center bias (slider value)")
+    parser.add_argument('--drops', type=int, default=50000, help="balls to drop (before splitting)")
+    parser.add_argument('--seed', type=int, default=None, help="seed for a reproducible run")
+    parser.add_argument('--workers', type=int, default=None, help="worker processes (default all cores)")
+    parser.add_argument('--levels', type=float, nargs='+', default=LEVELS, help="splitting depths on the outer lane, fractions of the pin rows")
+    parser.add_argument('--split', type=int, default=SPLIT, help="balls a ball becomes at every level")
+    parser.add_argument('--roulette', type=int, default=ROULETTE, help="one in this many balls off the lane goes on (1 for no roulette)")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    result = split_estimate(args.drops, args.rows, args.bias, args.seed, args.workers, sorted(args.levels), args.split, args.roulette)
+    elapsed = time.perf_counter() - start
+    start = time.perf_counter()
+    plain = simulate_drops(args.drops, args.rows, args.bias, None if args.seed is None else args.seed + 1, args.workers)
+    plain_rate = args.drops / (time.perf_counter() - start)
+
+    print(f"rows={args.rows} bias={args.bias} drops={args.drops}, {result['steps'] / args.drops:.0f} ball-steps per drop with splitting")
+    print(" bin multiplier  probability   95% interval             rel.err   plain   plain drops for this error  speedup")
+    payouts = payout_vector(args.rows)
+    for bin in range(len(result['probs'])):
+        prob, stderr = result['probs'][bin], result['stderr'][bin]
+        needed = prob * (1 - prob) / stderr ** 2 if stderr > 0 else np.inf
+        speedup = needed / plain_rate / elapsed
+        print(f"{bin:4d} {payouts[bin]:10g} {prob:12.4e}  [{result['low'][bin]:10.3e}, {result['high'][bin]:10.3e}]  "
+              f"{stderr / prob if prob else np.inf:8.3f} {plain[bin] / args.drops:8.1e} {needed:14,.0f}  {speedup:9.1f}x")
+    print(f"splitting {elapsed:.1f}s, plain drops {plain_rate:,.0f}/s")
+
+
+if __name__ == '__main__':
+    main()
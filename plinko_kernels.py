@@ -0,0 +1,150 @@
+'''
+Numba-compiled physics kernels (needs the optional numba package, see plinko_backends.py)
+The same step as plinko_physics.step_balls() with ContactKernel.bounce(), kick_stuck() and
+BallStreams draws inlined, compiled to machine code. Every operation is done in the same order as the
+NumPy code, so balls land in exactly the same bins with either backend.
+Also the compiled chain walk of plinko_surrogate.MarkovSurrogate.sample().
+'''
+import math
+import numpy as np
+from numba import njit
+from plinko_physics import PUSH_OUT, NUDGE, STUCK_FRAMES, SLOW_SPEED, KICK_SPEED
+from plinko_rng import PHILOX_M0, PHILOX_M1, PHILOX_W0, PHILOX_W1, PHILOX_ROUNDS, _mulhilo
+
+_mulhilo = njit(cache=True)(_mulhilo)
+
+# Slots of the geometry array made by board_arrays()
+PIN_START, SPACING, HALF_SPACING, CENTER_X, RADIUS_SUM, GRAVITY, LANDING_Y, RIGHT, LEFT, DAMP_X, DAMP_Y, BIN_SHIFT = range(12)
+# Slots of the layout array
+MIN_ROW, MIN_COL, REACH = range(3)
+
+
+def board_arrays(board):
+    """Everything the kernels need to know about a board, as plain arrays."""
+    kernel = board.kernel
+    geometry = np.array([board.pin_start, board.pin_spacing, board.pin_spacing // 2, board.center_x,
+                         board.radius_sum, board.gravity, board.landing_y, kernel.right, kernel.left,
+                         kernel.damp_x, kernel.damp_y, board.bin_shift], dtype=np.float64)
+    layout = np.array([board.index.min_row, board.index.min_col, board.index.reach], dtype=np.int64)
+    return board.pins_x, board.pins_y, board.index.grid, geometry, layout
+
+
+@njit(cache=True)
+def uniform(key, ball_id, draw):
+    """Draw number draw of ball ball_id, the same float as BallStreams.random()."""
+    c0, c1, c2, c3 = np.uint64((draw >> 2) + 1), np.uint64(0), np.uint64(0), np.uint64(0)
+    k0, k1 = key, np.uint64(ball_id)
+    for round in range(PHILOX_ROUNDS):
+        if round:
+            k0 += PHILOX_W0
+            k1 += PHILOX_W1
+        hi0, lo0 = _mulhilo(PHILOX_M0, c0)
+        hi1, lo1 = _mulhilo(PHILOX_M1, c2)
+        c0, c1, c2, c3 = hi1 ^ c1 ^ k0, lo1, hi0 ^ c3 ^ k1, lo0
+    lane = draw & 3
+    word = c0 if lane == 0 else c1 if lane == 1 else c2 if lane == 2 else c3
+    return (word >> np.uint64(11)) * (1.0 / 9007199254740992.0)
+
+
+@njit(cache=True)
+def run_balls(n, frames, x, y, vx, vy, ids, draws, contacts, slow, key, push, pins_x, pins_y, grid, geometry,
+              layout, hit_pin, landed, bins):
+    """Advance the first n balls up to frames frames each (one ball at a time) in place.
+    For every ball, hit_pin gets the pin it bounced off on its last frame (-1 for none), landed
+    whether it reached the bottom and bins its bin if it did (-1 otherwise).
+    Returns the number of ball-steps taken.
+    The pin lookup and the bounce are written out here rather than in helper functions: a call
+    that takes arrays pays for reference counting them, which costs more than the step itself."""
+    spacing = geometry[SPACING]
+    radius_sq = geometry[RADIUS_SUM] ** 2
+    slow_sq = SLOW_SPEED ** 2
+    min_row, min_col, reach = layout[MIN_ROW], layout[MIN_COL], layout[REACH]
+    steps = 0
+    for i in range(n):
+        bx, by, bvx, bvy = x[i], y[i], vx[i], vy[i]
+        run, crawl = contacts[i], slow[i]
+        pin = -1
+        landed[i] = False
+        bins[i] = -1
+        for _ in range(frames):
+            steps += 1
+            # Move, then apply gravity to y speed
+            bx += bvx
+            by += bvy
+            bvy += geometry[GRAVITY]
+
+            # First pin in board order the ball overlaps, like PinIndex.touching_one()
+            pin = -1
+            near_row = int(np.rint((by - geometry[PIN_START]) / spacing))
+            for row in range(near_row - reach, near_row + reach + 1):
+                row_idx = row - min_row
+                if row_idx < 0 or row_idx >= grid.shape[0]: continue
+                offset = geometry[HALF_SPACING] if (row & 1) == 0 else 0.0  # & rather than %, which compiles to a division
+                near_col = int(np.rint((bx - geometry[CENTER_X] - offset) / spacing))
+                for col in range(near_col - reach, near_col + reach + 1):
+                    col_idx = col - min_col
+                    if col_idx < 0 or col_idx >= grid.shape[1]: continue
+                    candidate = grid[row_idx, col_idx]
+                    if candidate < 0 or (pin >= 0 and candidate > pin): continue
+                    dx = bx - pins_x[candidate]
+                    dy = by - pins_y[candidate]
+                    if dx * dx + dy * dy < radius_sq: pin = candidate
+
+            # Same arithmetic as ContactKernel.bounce()
+            if pin >= 0:
+                ddx, ddy = bx - pins_x[pin], by - pins_y[pin]
+                dist = math.sqrt(ddx * ddx + ddy * ddy)
+                if dist == 0.0:
+                    nx, ny = 1.0, 0.0
+                else:
+                    nx, ny = ddx / dist, ddy / dist
+                displacement = geometry[RADIUS_SUM] - dist + PUSH_OUT
+                bx += nx * displacement
+                by += ny * displacement
+                dot = bvx * nx + bvy * ny
+                bvx = (bvx - 2 * dot * nx) * geometry[DAMP_X]
+                bvy = (bvy - 2 * dot * ny) * geometry[DAMP_Y]
+                if bx > geometry[RIGHT]: bvx -= push
+                elif bx < geometry[LEFT]: bvx += push
+                bx += NUDGE[0] if uniform(key, ids[i], draws[i]) < 0.5 else NUDGE[1]
+                draws[i] += 1
+
+            # Same bookkeeping as kick_stuck()
+            run = run + 1 if pin >= 0 else 0
+            crawl = crawl + 1 if bvx * bvx + bvy * bvy < slow_sq else 0
+            if pin >= 0 and (run >= STUCK_FRAMES or crawl >= STUCK_FRAMES):
+                bvx = math.copysign(max(abs(bvx), KICK_SPEED), bx - pins_x[pin])
+                run = crawl = 0
+
+            if by > geometry[LANDING_Y]:
+                landed[i] = True
+                bins[i] = int((bx - geometry[CENTER_X] + geometry[BIN_SHIFT]) // spacing)
+                break
+        x[i], y[i], vx[i], vy[i] = bx, by, bvx, bvy
+        contacts[i], slow[i] = run, crawl
+        hit_pin[i] = pin
+    return steps
+
+
+@njit(cache=True)
+def walk_chain(n, seed, start, max_events, first, accept, alias, targets, bins):
+    """Walk n balls through a MarkovSurrogate chain from state start, outcomes (targets past start) in bins.
+    The transitions of state s are first[s] .. first[s + 1] - 1 with Walker alias tables: slot j is
+    taken with probability accept[j] and slot alias[j] otherwise. Balls in a state without transitions,
+    or still walking after max_events, get start (lost). Random numbers come from numba's generator seeded with seed."""
+    np.random.seed(seed)
+    for i in range(n):
+        state = start
+        bins[i] = start
+        for _ in range(max_events):
+            lo = first[state]
+            k = first[state + 1] - lo
+            if k == 0: break
+            u = np.random.random() * k
+            j = int(u)
+            slot = lo + j
+            if u - j >= accept[slot]: slot = alias[slot]
+            state = targets[slot]
+            if state > start:
+                bins[i] = state
+                break
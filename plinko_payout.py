@@ -0,0 +1,129 @@
+'''
+Payout tables and return-to-player (RTP) analysis
+Compiles the game's bin multiplier texts into numeric payout vectors per pin_rows (boards taller
+than the 17 entry tables stretch the 16 row table over their bins) and combines them with landing
+distributions to get expected return, variance and hit frequency for every
+(rows, bias) setting in one vectorized pass.
+Usage -
+    python plinko_payout.py                          (use the stored bin tables)
+    python plinko_payout.py --simulate --drops 100000 --csv rtp.csv
+'''
+import argparse
+import numpy as np
+from plinko_tables import BinTables, ROWS_RANGE, BIAS_RANGE
+from plinko_sim import simulate_grid
+
+# Multipliers shown on the bins, the game uses the low table below 10 rows
+BIN_TEXTS = ['1000', '130', '26x', '9x', '4x', '2x', '0.2x', '0.2x', '0.2x','0.2x','0.2x','2x','4x','9x','26x', '130', '1000']
+LOW_BIN_TEXTS = ['1', '1', '1', '9x', '5x', '2x', '1x', '0.5x', '0.2x', '0.5x', '1x', '2x', '5x', '9x', '1', '1', '1']
+LOW_ROWS = 10
+TABLE_ROWS = 16  # Tallest board the text tables cover bin by bin
+
+
+def parse_multiplier(text):
+    return float(text.replace('x', ''))
+
+
+def bin_texts_for(pin_rows):
+    return LOW_BIN_TEXTS if pin_rows < LOW_ROWS else BIN_TEXTS
+
+
+def text_index(pin_rows, bin):
+    """Position of a bin in the 17 entry text table (the center entry is skipped for odd rows)."""
+    index = bin + 8 - pin_rows // 2
+    if pin_rows % 2 and bin <= pin_rows // 2: index -= 1
+    return index
+
+
+def multiplier_text(multiplier):
+    """Bin text for a multiplier, written like the tables (no x from 100 up)."""
+    return f"{multiplier:g}" if multiplier >= 100 else f"{multiplier:g}x"
+
+
+def stretched_multipliers(pin_rows):
+    """Multipliers of a board taller than TABLE_ROWS: every bin gets the 16 row multiplier at the
+    same relative distance from the center, interpolated between bins on a log scale and rounded
+    to two significant digits, so the edge bins keep the top prizes and get rarer as rows grow."""
+    table = np.array([parse_multiplier(text) for text in BIN_TEXTS])
+    table_distance = np.abs(np.arange(TABLE_ROWS + 1) - TABLE_ROWS / 2) / (TABLE_ROWS / 2)
+    half = TABLE_ROWS // 2 + 1  # Center to edge
+    distance = np.abs(np.arange(pin_rows + 1) - pin_rows / 2) / (pin_rows / 2)
+    multipliers = np.exp(np.interp(distance, table_distance[half - 1:], np.log(table[half - 1:])))
+    digits = 1 - np.floor(np.log10(multipliers)).astype(int)
+    return np.array([round(value, digit) for value, digit in zip(multipliers, digits)])
+
+
+def bin_labels(pin_rows):
+    """Text shown on every bin (length pin_rows + 1)."""
+    if pin_rows > TABLE_ROWS: return [multiplier_text(value) for value in stretched_multipliers(pin_rows)]
+    texts = bin_texts_for(pin_rows)
+    return [texts[text_index(pin_rows, bin)] for bin in range(pin_rows + 1)]
+
+
+def payout_vector(pin_rows):
+    """Multiplier of every bin (length pin_rows + 1)."""
+    return np.array([parse_multiplier(text) for text in bin_labels(pin_rows)])
+
+
+def payout_matrix(rows_range):
+    """(len(rows_range), max bins) multipliers, zero past each board's last bin."""
+    matrix = np.zeros((len(rows_range), max(rows_range) + 1))
+    for i, rows in enumerate(rows_range):
+        matrix[i, :rows + 1] = payout_vector(rows)
+    return matrix
+
+
+def rtp_stats(probs, payouts):
+    """Per-bet statistics for landing distributions probs[..., bin] and multipliers payouts[..., bin].
+    Probability mass missing from probs (balls that miss every bin) pays nothing.
+    Returns a dict of arrays shaped like probs without the bin axis:
+    rtp (expected multiplier), variance and std of the multiplier, hit_frequency (P(multiplier >= 1))."""
+    probs = np.nan_to_num(np.asarray(probs, dtype=np.float64))
+    payouts = np.asarray(payouts, dtype=np.float64)
+    rtp = (probs * payouts).sum(axis=-1)
+    second = (probs * payouts * payouts).sum(axis=-1)
+    variance = second - rtp * rtp
+    return {'rtp': rtp, 'variance': variance, 'std': np.sqrt(np.maximum(variance, 0)),
+            'hit_frequency': (probs * (payouts >= 1)).sum(axis=-1)}
+
+
+def rtp_grid(distributions, rows_range):
+    """rtp_stats() for a (rows, bias, bins) distribution grid, configurations without data are NaN."""
+    distributions = np.asarray(distributions, dtype=np.float64)
+    stats = rtp_stats(distributions, payout_matrix(rows_range)[:, None, :])
+    missing = np.isnan(distributions).all(axis=-1)
+    for value in stats.values():
+        value[missing] = np.nan
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="RTP, variance and hit frequency for every rows/bias setting")
+    parser.add_argument('--simulate', action='store_true', help="simulate fresh distributions instead of reading the tables")
+    parser.add_argument('--drops', type=int, default=100000, help="drops per configuration with --simulate")
+    parser.add_argument('--seed', type=int, default=None, help="seed for --simulate")
+    parser.add_argument('--workers', type=int, default=None, help="worker processes for --simulate (default all cores)")
+    parser.add_argument('--csv', default=None, help="also write every statistic to this CSV file")
+    args = parser.parse_args()
+
+    if args.simulate:
+        distributions = simulate_grid(args.drops, ROWS_RANGE, BIAS_RANGE, args.seed, args.workers) / args.drops
+    else:
+        distributions = BinTables().grid()
+    stats = rtp_grid(distributions, ROWS_RANGE)
+
+    print("RTP % (rows down, bias across)")
+    print('rows ' + ''.join(f"{bias:>7d}" for bias in BIAS_RANGE))
+    for i, rows in enumerate(ROWS_RANGE):
+        print(f"{rows:4d} " + ''.join(f"{100 * value:7.2f}" for value in stats['rtp'][i]))
+    if args.csv:
+        with open(args.csv, 'w') as file:
+            file.write('rows,bias,' + ','.join(stats) + '\n')
+            for i, rows in enumerate(ROWS_RANGE):
+                for j, bias in enumerate(BIAS_RANGE):
+                    file.write(f"{rows},{bias}," + ','.join(f"{stats[name][i, j]:.8g}" for name in stats) + '\n')
+        print(f"Saved {args.csv}")
+
+
+if __name__ == '__main__':
+    main()
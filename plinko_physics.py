@@ -0,0 +1,660 @@
+'''
+Ball physics engine for the plinko board
+Keeps every live ball in contiguous NumPy arrays (structure of arrays) and advances gravity,
+pin collisions, the center bias push and landing detection for the whole batch in one step.
+Used by plinko_balls.py and by the headless tools, so it must not import pygame.
+'''
+import hashlib
+import math
+import numpy as np
+from plinko_rng import BallStreams, START_DRAWS
+
+# Board settings (same values plinko_balls.py uses at 1920x1080)
+WIDTH = 1920
+RATIO = WIDTH / 1280
+PIN_RADIUS = int(5 * RATIO)
+PIN_SPACING = int(40 * RATIO)
+PIN_START = 0
+BALL_RADIUS = int(9 * RATIO)
+FALL_SPEED_INCREMENT = 0.6 * RATIO
+
+# Bounce settings
+BOUNCE_DAMPING = 0.5  # Applied to both velocity components after the reflection
+X_DAMPING = 0.5  # Extra damping on x so the ball bounces more up than out
+PUSH_OUT = 0.5  # Extra pixels to move the ball out of the pin
+BIAS_SCALE = 20  # Center push is bias / BIAS_SCALE
+NUDGE = (-1, 1)  # Random x nudge after every bounce
+STUCK_FRAMES = 12  # Consecutive frames of pin contact (or of crawling below SLOW_SPEED) before a ball is kicked
+SLOW_SPEED = 1.0  # Pixels per frame
+KICK_SPEED = 2.0  # Least sideways speed a kicked ball rolls off its pin with
+PHYSICS_VERSION = 3  # Bump when the step or bounce code changes behaviour
+SCALAR_CONTACTS = 32  # Frames with at most this many contacts resolve them one by one
+BALL_RESTITUTION = 0.5  # Ball-ball bounciness, only used by the optional collide_balls()
+NEIGHBOR_CELLS = ((0, 0), (1, 0), (-1, 1), (0, 1), (1, 1))  # Half of the 3x3 block, so every pair of cells is checked once
+
+
+def physics_fingerprint():
+    """Short hash of every constant that changes where balls land, used to invalidate cached results."""
+    constants = (PHYSICS_VERSION, WIDTH, PIN_RADIUS, PIN_SPACING, PIN_START, BALL_RADIUS, FALL_SPEED_INCREMENT,
+                 BOUNCE_DAMPING, X_DAMPING, PUSH_OUT, BIAS_SCALE, NUDGE, STUCK_FRAMES, SLOW_SPEED, KICK_SPEED)
+    return hashlib.sha1(repr(constants).encode()).hexdigest()[:16]
+
+
+class PinLayout:
+    """Shape of a pin field as lattice cells: pin k sits in row rows[k] (1 is the top row) and column
+    cols[k] of the staggered lattice, whose even rows are shifted half a spacing right. Cells are
+    kept in board order (row by row, left to right), which is the order Board numbers the pins in.
+    Any shape on the lattice gets the shared PinIndex lookup and bin mapping through Board."""
+
+    def __init__(self, rows, cols):
+        rows = np.asarray(rows, dtype=np.int64)
+        cols = np.asarray(cols, dtype=np.int64)
+        if len(rows) == 0 or rows.min() < 1: raise ValueError("A layout needs pins, in rows numbered from 1")
+        order = np.lexsort((cols, rows))
+        self.rows, self.cols = rows[order], cols[order]
+
+    @classmethod
+    def pyramid(cls, pin_rows):
+        """The game's pyramid: row r has r + 2 pins centered on the board."""
+        cells = [(row, col) for row in range(1, pin_rows + 1) for col in range(-(row // 2) - 1, (row - 1) // 2 + 2)]
+        return cls(*zip(*cells))
+
+    @classmethod
+    def rectangle(cls, pin_rows, pin_cols):
+        """pin_rows rows of pin_cols pins, mirror symmetric like the field of scripts/00_plinko_faling_balls_rect.py:
+        pin_cols pins can only be centered on every other row of the staggered lattice, the rows between get one fewer."""
+        mask = np.ones((pin_rows, pin_cols), dtype=bool)
+        mask[np.arange(pin_rows) % 2 == pin_cols % 2, 0] = False  # Row i + 1 has the other stagger
+        return cls.from_mask(mask)
+
+    @classmethod
+    def from_mask(cls, mask, first_col=None):
+        """Pins where mask[i, j] is True, in row i + 1 and column j + first_col.
+        By default every row is centered for its stagger: mask column j sits (mask width - 1) / 2 - j
+        spacings left of the center on rows where that falls on the lattice, half a spacing further
+        left on the others, so a mask row is mirror symmetric on the board if it is without its first cell there."""
+        mask = np.asarray(mask, dtype=bool)
+        rows, cols = np.nonzero(mask)
+        if first_col is None:
+            staggered = (rows + 1) % 2 == 0  # Even rows sit half a spacing right, see Board.row_offset()
+            first_col = (1 - mask.shape[1] - staggered) // 2
+        return cls(rows + 1, cols + first_col)
+
+    @property
+    def pin_rows(self):
+        return int(self.rows.max())
+
+    def bottom_cols(self):
+        """First and last column of the bottom row, whose gaps are the landing bins."""
+        bottom = self.cols[self.rows == self.pin_rows]
+        return int(bottom.min()), int(bottom.max())
+
+
+class Board:
+    """Pin positions and landing geometry for one board, the game's pyramid unless a PinLayout is given.
+    Balls land in the gaps between neighboring columns of the bottom row."""
+
+    def __init__(self, pin_rows, width=WIDTH, pin_spacing=PIN_SPACING, pin_radius=PIN_RADIUS,
+                 ball_radius=BALL_RADIUS, pin_start=PIN_START, gravity=FALL_SPEED_INCREMENT, layout=None):
+        if layout is None: layout = PinLayout.pyramid(pin_rows)
+        self.layout = layout
+        pin_rows = layout.pin_rows
+        self.pin_rows = pin_rows
+        self.width = width
+        self.center_x = width // 2
+        self.pin_spacing = pin_spacing
+        self.pin_radius = pin_radius
+        self.ball_radius = ball_radius
+        self.pin_start = pin_start
+        self.gravity = gravity
+        self.radius_sum = ball_radius + pin_radius
+        self.landing_y = (pin_rows + 0.5) * pin_spacing + pin_start
+
+        self.pins_x = (self.center_x + layout.cols * pin_spacing + self.row_offset(layout.rows)).astype(np.float64)
+        self.pins_y = (layout.rows * pin_spacing + pin_start).astype(np.float64)
+        self.pins = list(zip(self.pins_x.tolist(), self.pins_y.tolist()))
+        self.pin_cells = list(zip(layout.rows.tolist(), layout.cols.tolist()))  # (row, col) lattice cell of every pin
+
+        # Bins are the gaps of the bottom row, bin_shift is the distance from center_x back to the first edge
+        first_col, last_col = layout.bottom_cols()
+        self.num_bins = last_col - first_col
+        self.bin_shift = -(first_col * pin_spacing + int(self.row_offset(pin_rows)))
+        self.index = PinIndex(self)
+        self.kernel = ContactKernel(self)
+
+    def row_offset(self, row):
+        """x shift of a pin row, even rows are staggered by half a spacing."""
+        return np.where(np.asarray(row) % 2 == 0, self.pin_spacing // 2, 0)
+
+    def bin_of(self, x):
+        """Landing bin for x position(s), same formula as the game loop."""
+        return np.floor_divide(np.asarray(x) - self.center_x + self.bin_shift, self.pin_spacing).astype(np.int64)
+
+    def bin_edges(self):
+        """x edges of the num_bins bins (num_bins + 1 values), bin i is [edges[i], edges[i + 1])."""
+        return self.center_x - self.bin_shift + self.pin_spacing * np.arange(self.num_bins + 1, dtype=np.float64)
+
+    def start_range(self):
+        """Inclusive x range balls are dropped from (between the two top pins)."""
+        return (self.center_x - self.pin_spacing + self.pin_radius,
+                self.center_x + self.pin_spacing - self.pin_radius)
+
+
+class PinIndex:
+    """Constant-time pin lookup on the staggered lattice.
+    A ball can only touch pins whose row and column are within `reach` cells of its nearest
+    lattice cell, so candidates are found with arithmetic instead of scanning every pin."""
+
+    def __init__(self, board):
+        self.board = board
+        spacing = board.pin_spacing
+        self.reach = self.cells_within(board.radius_sum)
+        self.pad = self.reach + 1
+        rows, cols = board.layout.rows, board.layout.cols
+        self.min_row = int(rows.min()) - self.pad
+        self.min_col = int(cols.min()) - self.pad
+        n_rows = int(rows.max()) - self.min_row + self.pad + 1
+        n_cols = int(cols.max()) - self.min_col + self.pad + 1
+
+        # grid[row, col] -> index into board.pins, -1 where there is no pin
+        self.grid = np.full((n_rows, n_cols), -1, dtype=np.int64)
+        self.grid[rows - self.min_row, cols - self.min_col] = np.arange(len(rows))
+        self.row_steps, self.col_steps = self._steps(self.reach)
+        self.grid_rows = self.grid.tolist()  # Plain lists for the scalar lookup
+
+    def cells_within(self, distance):
+        """Lattice cells around a point's nearest cell that can hold pins within distance of it
+        (0, only the nearest row/column, while distance <= spacing / 2)."""
+        return max(0, int(np.ceil(distance / self.board.pin_spacing - 0.5)))
+
+    @staticmethod
+    def _steps(reach):
+        offsets = np.arange(-reach, reach + 1)
+        return np.repeat(offsets, len(offsets)), np.tile(offsets, len(offsets))
+
+    @property
+    def candidates_per_ball(self):
+        return len(self.row_steps)
+
+    def candidates(self, x, y, reach=None):
+        """Pin indices (n, k) each ball could be touching, -1 for empty cells.
+        reach (in cells, see cells_within()) widens the search for longer distances than radius_sum."""
+        board = self.board
+        spacing = board.pin_spacing
+        n_rows, n_cols = self.grid.shape
+        row_steps, col_steps = (self.row_steps, self.col_steps) if reach is None else self._steps(reach)
+        if reach is None: reach = self.reach
+        near_row = np.rint((np.asarray(y) - board.pin_start) / spacing).astype(np.int64)
+        row_idx = np.clip(near_row - self.min_row, reach, n_rows - 1 - reach)
+        row_idx = np.clip(row_idx[:, None] + row_steps, 0, n_rows - 1)
+        row = row_idx + self.min_row
+        col = np.rint((np.asarray(x)[:, None] - board.center_x - board.row_offset(row)) / spacing).astype(np.int64)
+        col_idx = np.clip(col - self.min_col + col_steps, 0, n_cols - 1)
+        return self.grid[row_idx, col_idx]
+
+    def touching(self, x, y):
+        """First pin (in board.pins order) each ball overlaps, -1 if none."""
+        board = self.board
+        cand = self.candidates(x, y)
+        valid = cand >= 0
+        safe = np.where(valid, cand, 0)
+        dx = np.asarray(x)[:, None] - board.pins_x[safe]
+        dy = np.asarray(y)[:, None] - board.pins_y[safe]
+        touching = valid & (dx * dx + dy * dy < board.radius_sum ** 2)
+        no_pin = len(board.pins)
+        first = np.where(touching, cand, no_pin).min(axis=1)
+        return np.where(first < no_pin, first, -1)
+
+    def swept(self, x0, y0, x1, y1, reach=None, inside=True):
+        """Continuous version of touching(): the first pin each ball comes within reach (default
+        radius_sum) of while moving in a straight line from (x0, y0) to (x1, y1), so fast balls
+        cannot pass through a pin between two positions. Returns (pin, t) with t the fraction of
+        the move done at first contact and pin -1, t = 1 for balls that touch nothing.
+        Pins a ball starts inside reach of count as touched at t = 0, or are ignored if inside is False."""
+        board = self.board
+        if reach is None: reach = board.radius_sum
+        x0, y0, x1, y1 = (np.asarray(a, dtype=np.float64) for a in (x0, y0, x1, y1))
+        if len(x0) == 0: return np.empty(0, dtype=np.int64), np.empty(0)
+
+        # Any pin within reach of the path is within reach + half its length of its midpoint
+        half_length = np.hypot(x1 - x0, y1 - y0).max() / 2
+        cand = self.candidates((x0 + x1) / 2, (y0 + y1) / 2, self.cells_within(reach + half_length))
+
+        # Solve |start - pin + t * move| = radius_sum for the first t in [0, 1]
+        safe = np.maximum(cand, 0)
+        fx = x0[:, None] - board.pins_x[safe]
+        fy = y0[:, None] - board.pins_y[safe]
+        mx, my = (x1 - x0)[:, None], (y1 - y0)[:, None]
+        a = mx * mx + my * my
+        half_b = fx * mx + fy * my
+        c = fx * fx + fy * fy - reach ** 2
+        disc = half_b * half_b - a * c
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t = np.where(c < 0, 0.0, (-half_b - np.sqrt(disc)) / a)
+        entering = (c >= 0) & (half_b < 0) & (disc >= 0) & (t <= 1)
+        hits = (cand >= 0) & (entering | ((c < 0) & inside))
+        t = np.where(hits, t, np.inf)
+
+        # Earliest contact, ties (several overlaps) go to the first pin in board order like touching()
+        first_t = t.min(axis=1)
+        no_pin = len(board.pins)
+        pin = np.where(hits & (t == first_t[:, None]), cand, no_pin).min(axis=1)
+        hit = pin < no_pin
+        return np.where(hit, pin, -1), np.where(hit, first_t, 1.0)
+
+    def touching_one(self, x, y):
+        """Scalar touching() for one ball, no NumPy overhead."""
+        board = self.board
+        spacing = board.pin_spacing
+        radius_sq = board.radius_sum ** 2
+        near_row = round((y - board.pin_start) / spacing)
+        first = -1
+        for row in range(near_row - self.reach, near_row + self.reach + 1):
+            row_idx = row - self.min_row
+            if row_idx < 0 or row_idx >= len(self.grid_rows): continue
+            grid_row = self.grid_rows[row_idx]
+            offset = spacing // 2 if row % 2 == 0 else 0
+            near_col = round((x - board.center_x - offset) / spacing)
+            for col in range(near_col - self.reach, near_col + self.reach + 1):
+                col_idx = col - self.min_col
+                if col_idx < 0 or col_idx >= len(grid_row): continue
+                pin = grid_row[col_idx]
+                if pin < 0 or (first >= 0 and pin > first): continue
+                dx = x - board.pins[pin][0]
+                dy = y - board.pins[pin][1]
+                if dx * dx + dy * dy < radius_sq: first = pin
+        return first
+
+
+class BallBatch:
+    """Live balls stored as parallel float64 arrays [x, y, vx, vy].
+    prev_x and prev_y hold the positions before the last step so drawing can interpolate,
+    ids numbers the balls in the order they were added and is never reused, draws counts
+    how far each ball is into its BallStreams stream, and contacts and slow count its latest
+    run of frames touching a pin and below SLOW_SPEED (see kick_stuck())."""
+    fields = ('x', 'y', 'vx', 'vy', 'prev_x', 'prev_y', 'ids', 'draws', 'contacts', 'slow')
+    counters = ('ids', 'draws', 'contacts', 'slow')
+
+    def __init__(self, capacity=64):
+        for name in self.fields:
+            setattr(self, name, np.empty(capacity, dtype=np.int64 if name in self.counters else np.float64))
+        self.count = 0
+        self.next_id = 0
+
+    def __len__(self):
+        return self.count
+
+    def _grow(self, needed):
+        capacity = max(needed, 2 * len(self.x))
+        for name in self.fields:
+            old = getattr(self, name)
+            new = np.empty(capacity, dtype=old.dtype)
+            new[:self.count] = old[:self.count]
+            setattr(self, name, new)
+
+    def add(self, x, y, vx=0.0, vy=0.0, ids=None):
+        """Add one ball or an array of balls, numbered from next_id unless ids are given."""
+        x = np.atleast_1d(np.asarray(x, dtype=np.float64))
+        n = len(x)
+        end = self.count + n
+        if end > len(self.x): self._grow(end)
+        self.x[self.count:end] = x
+        self.y[self.count:end] = y
+        self.vx[self.count:end] = vx
+        self.vy[self.count:end] = vy
+        self.prev_x[self.count:end] = self.x[self.count:end]
+        self.prev_y[self.count:end] = self.y[self.count:end]
+        if ids is None: ids = np.arange(self.next_id, self.next_id + n)
+        self.ids[self.count:end] = ids
+        self.next_id = max(self.next_id, int(np.max(ids)) + 1)
+        self.draws[self.count:end] = START_DRAWS
+        self.contacts[self.count:end] = 0
+        self.slow[self.count:end] = 0
+        self.count = end
+
+    def remove(self, mask):
+        """Drop the balls where mask is True (one entry per live ball) by swap-remove: the gaps are
+        filled with the last live balls, so only as many balls move as were removed and the order
+        of the rest is not kept. Balls are told apart by ids, never by position in the arrays."""
+        mask = np.asarray(mask, dtype=bool)
+        live = self.count - np.count_nonzero(mask)
+        holes = np.flatnonzero(mask[:live])
+        if len(holes):
+            movers = live + np.flatnonzero(~mask[live:])
+            for name in self.fields:
+                arr = getattr(self, name)
+                arr[holes] = arr[movers]
+        self.count = live
+
+    def clear(self):
+        self.count = 0
+
+    def positions(self):
+        """Views of the live x and y positions."""
+        return self.x[:self.count], self.y[:self.count]
+
+    def save_previous(self):
+        """Remember the current positions as the start of the next step."""
+        self.prev_x[:self.count] = self.x[:self.count]
+        self.prev_y[:self.count] = self.y[:self.count]
+
+    def interpolated(self, alpha):
+        """Positions alpha (0..1) of the way from the previous step to the current one."""
+        n = self.count
+        x = self.prev_x[:n] + (self.x[:n] - self.prev_x[:n]) * alpha
+        y = self.prev_y[:n] + (self.y[:n] - self.prev_y[:n]) * alpha
+        return x, y
+
+
+def start_position(board, u_x, u_y):
+    """Map uniform draws to start positions, same ranges as the game: x between the two top pins, y just above the board."""
+    low, high = board.start_range()
+    x = low + np.floor(np.asarray(u_x) * (high - low + 1))
+    y = -2 * board.ball_radius + np.floor(np.asarray(u_y) * (board.ball_radius + 1))
+    return x, y
+
+
+def drop_start(board, n, rng, ids=None):
+    """Start positions for n drops, from each ball's own stream when rng is BallStreams."""
+    if isinstance(rng, BallStreams):
+        return start_position(board, rng.random(ids, 0), rng.random(ids, 1))
+    return start_position(board, rng.random(n), rng.random(n))
+
+
+def draw_nudges(rng, balls, hit):
+    """Random -1/+1 x nudge for each hit ball, from the ball's own stream when rng is BallStreams."""
+    if isinstance(rng, BallStreams):
+        u = rng.random(balls.ids[hit], balls.draws[hit])
+        balls.draws[hit] += 1
+    else:
+        u = rng.random(len(hit))
+    return np.where(u < 0.5, NUDGE[0], NUDGE[1])
+
+
+def run_drops(board, x, y, bias, rng, max_frames=10000, ids=None, step=None):
+    """Drop balls from (x, y) with step_balls() (or another step function with its signature, see
+    plinko_backends.py) until all have landed, returns their bins in drop order.
+    ids are the balls' stream ids when rng is BallStreams. Balls still on the board after max_frames get bin -1."""
+    balls = BallBatch(len(x))
+    balls.add(x, y, ids=ids)
+    return settle_balls(balls, board, bias, rng, max_frames, step)
+
+
+def settle_balls(balls, board, bias, rng=None, max_frames=10000, step=None):
+    """Step every live ball of a batch to the bottom with step_balls() (or another step function, see
+    run_drops()) and empty the batch, returns the bins in batch order. With BallStreams each ball
+    continues its own stream, so it lands where it would have in the game. Balls still on the board
+    after max_frames get bin -1."""
+    if step is None: step = step_balls
+    all_ids = balls.ids[:balls.count].copy()
+    sorter = np.argsort(all_ids)
+    bins = np.full(len(all_ids), -1, dtype=np.int64)
+    for _ in range(max_frames):
+        if balls.count == 0: break
+        _, landed_bins, landed_ids, _ = step(balls, board, bias, rng)
+        bins[sorter[np.searchsorted(all_ids, landed_ids, sorter=sorter)]] = landed_bins
+    balls.clear()
+    return bins
+
+
+def step_balls(balls, board, bias, rng=None, swept=False):
+    """Advance every live ball one frame. rng is a numpy Generator or BallStreams.
+    Returns (pins hit, bins and ids of the balls that landed this frame, ids of the balls that hit pins[i]).
+    A ball resolves at most one pin per frame: the first overlapping pin in board.pins order,
+    which is the pin the per-ball loop in the game used to hit first. swept adds the tunneling
+    check of step_balls_swept()."""
+    if rng is None: rng = np.random.default_rng()
+    n = balls.count
+    if n == 0:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty, empty, empty
+    x, y, vx, vy = balls.x[:n], balls.y[:n], balls.vx[:n], balls.vy[:n]
+    if swept: start_x, start_y = x.copy(), y.copy()
+
+    # Move, then apply gravity to y speed
+    x += vx
+    y += vy
+    vy += board.gravity
+
+    # Check for collisions with the few pins near each ball
+    touching = board.index.touching(x, y)
+    if swept: catch_tunneling(board, start_x, start_y, x, y, touching)
+    hit = np.flatnonzero(touching >= 0)
+    pin = touching[hit]
+    if len(hit):
+        resolve_contacts(balls, board, hit, pin, bias, rng)
+    kick_stuck(balls, board, slice(0, n), hit, pin)
+
+    # Remove the balls at the bottom
+    hit_ids = balls.ids[hit]
+    landed = y > board.landing_y
+    bins = board.bin_of(x[landed])
+    ids = balls.ids[:n][landed]
+    if landed.any(): balls.remove(landed)
+    return pin, bins, ids, hit_ids
+
+
+def step_balls_swept(balls, board, bias, rng=None):
+    """step_balls() with continuous collision detection, to measure what tunneling does to the outcome.
+    A ball that passes through a pin between two frames without overlapping it at either (possible
+    for fast balls) bounces where it first touches the pin. The game steps without this check, so
+    some balls land elsewhere, and the swept test makes a step about twice as slow."""
+    return step_balls(balls, board, bias, rng, swept=True)
+
+
+def catch_tunneling(board, x0, y0, x, y, touching):
+    """Balls touching no pin (touching[i] < 0) that crossed one on the way from (x0, y0) to (x, y)
+    are moved back to where they first touched it and get it in touching, all in place."""
+    missed = np.flatnonzero(touching < 0)
+    crossed, t = board.index.swept(x0[missed], y0[missed], x[missed], y[missed], inside=False)
+    tunneled = missed[crossed >= 0]
+    if len(tunneled) == 0: return
+    t = t[crossed >= 0]
+    x[tunneled] = x0[tunneled] + (x[tunneled] - x0[tunneled]) * t
+    y[tunneled] = y0[tunneled] + (y[tunneled] - y0[tunneled]) * t
+    touching[tunneled] = crossed[crossed >= 0]
+
+
+def ball_pairs(x, y, radius):
+    """Broadphase for ball-ball contacts: (i, j) index arrays of every pair of balls closer than
+    2 * radius, each pair once. Balls are bucketed in a uniform grid of one-diameter cells
+    by sorting their cell keys, so overlapping balls are always in the same or adjacent cells and
+    each ball is only compared with the few balls found by searchsorted() in its neighbor cells."""
+    n = len(x)
+    if n < 2:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty
+    cell = 2 * radius
+    col = ((x - x.min()) // cell).astype(np.int64)
+    row = ((y - y.min()) // cell).astype(np.int64)
+    row_length = int(col.max()) + 2  # A spare column so col - 1 and col + 1 never wrap into another row
+    order = np.argsort(row * row_length + col, kind='stable')
+    keys = (row * row_length + col)[order]
+    position = np.arange(n)
+
+    # Expand every sorted ball's [start, end) range of neighbors into flat pair lists
+    firsts, seconds = [], []
+    for dx, dy in NEIGHBOR_CELLS:
+        target = keys + dy * row_length + dx
+        start = np.searchsorted(keys, target, 'left')
+        end = np.searchsorted(keys, target, 'right')
+        if dx == dy == 0: start = position + 1  # Same cell, only the balls after this one
+        count = np.maximum(end - start, 0)
+        total = int(count.sum())
+        if total == 0: continue
+        first = np.repeat(position, count)
+        firsts.append(first)
+        seconds.append(start[first] + np.arange(total) - (np.cumsum(count) - count)[first])
+    if not firsts:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty
+    i, j = order[np.concatenate(firsts)], order[np.concatenate(seconds)]
+
+    # Narrowphase
+    dx, dy = x[j] - x[i], y[j] - y[i]
+    close = dx * dx + dy * dy < cell * cell
+    return i[close], j[close]
+
+
+def collide_balls(balls, board, restitution=BALL_RESTITUTION):
+    """Separate overlapping balls and bounce them off each other (equal masses), in place.
+    Not part of the simulated distribution: balls stop being independent, so the bins no longer
+    follow from each ball's own stream. Returns the number of colliding pairs."""
+    x, y, vx, vy = balls.x[:balls.count], balls.y[:balls.count], balls.vx[:balls.count], balls.vy[:balls.count]
+    i, j = ball_pairs(x, y, board.ball_radius)
+    if len(i) == 0: return 0
+    dx, dy = x[j] - x[i], y[j] - y[i]
+    dist = np.sqrt(dx * dx + dy * dy)
+    safe = np.where(dist > 0, dist, 1.0)
+    nx, ny = np.where(dist > 0, dx / safe, 1.0), np.where(dist > 0, dy / safe, 0.0)
+
+    # All pairs are resolved at once, so a ball in several contacts gets the average of its
+    # corrections rather than their sum, which would overshoot and pump energy into piles
+    contacts = np.bincount(np.concatenate([i, j]))
+    share_i, share_j = 1 / contacts[i], 1 / contacts[j]
+
+    # Push both balls half of the overlap apart along the line between their centers
+    shift = (2 * board.ball_radius - dist) / 2
+    np.add.at(x, i, -nx * shift * share_i)
+    np.add.at(y, i, -ny * shift * share_i)
+    np.add.at(x, j, nx * shift * share_j)
+    np.add.at(y, j, ny * shift * share_j)
+
+    # Exchange the approaching part of their relative speed
+    closing = (vx[j] - vx[i]) * nx + (vy[j] - vy[i]) * ny
+    impulse = np.where(closing < 0, -(1 + restitution) / 2 * closing, 0.0)
+    np.add.at(vx, i, -nx * impulse * share_i)
+    np.add.at(vy, i, -ny * impulse * share_i)
+    np.add.at(vx, j, nx * impulse * share_j)
+    np.add.at(vy, j, ny * impulse * share_j)
+    return len(i)
+
+
+def kick_stuck(balls, board, moved, hit, pin):
+    """Stuck-ball bookkeeping after a frame for the balls at moved (indices or a slice), hit being
+    those of them that bounced off pin this frame. A ball that bounces with STUCK_FRAMES contacts
+    in a row (jittering on a pin) or STUCK_FRAMES frames below SLOW_SPEED (wedged between two pins)
+    is kicked off the side of its pin at KICK_SPEED or more and its counts restart, which bounds
+    how many frames in a row any ball can spend in collision work."""
+    vx, vy = balls.vx, balls.vy
+    hit_contacts = balls.contacts[hit] + 1
+    balls.contacts[moved] = 0
+    balls.contacts[hit] = hit_contacts
+    balls.slow[moved] = (balls.slow[moved] + 1) * (vx[moved] ** 2 + vy[moved] ** 2 < SLOW_SPEED ** 2)
+    if len(hit) == 0: return
+    stuck = (hit_contacts >= STUCK_FRAMES) | (balls.slow[hit] >= STUCK_FRAMES)
+    if not stuck.any(): return
+    kicked, kicked_pin = hit[stuck], pin[stuck]
+    vx[kicked] = np.copysign(np.maximum(np.abs(vx[kicked]), KICK_SPEED), balls.x[kicked] - board.pins_x[kicked_pin])
+    balls.contacts[kicked] = 0
+    balls.slow[kicked] = 0
+
+
+def resolve_contacts(balls, board, hit, pin, bias, rng):
+    """Push out, reflect, damp, bias and nudge the balls hit[i] off pins pin[i]."""
+    board.kernel.resolve(balls, hit, pin, bias, draw_nudges(rng, balls, hit))
+
+
+class ContactKernel:
+    """Ball-pin collision response with the board constants folded in up front.
+    The contact normal is the pin-to-ball offset over its length (no atan2/cos/sin), bounce() is
+    plain float arithmetic and resolve() works in scratch arrays kept between frames, so once the
+    buffers have grown to the busiest frame no contact allocates anything."""
+
+    def __init__(self, board):
+        self.pins_x = board.pins_x
+        self.pins_y = board.pins_y
+        self.pin_x = board.pins_x.tolist()  # Native floats for bounce()
+        self.pin_y = board.pins_y.tolist()
+        self.radius_sum = float(board.radius_sum)
+        self.damp_x = BOUNCE_DAMPING * X_DAMPING
+        self.damp_y = BOUNCE_DAMPING
+        self.right = board.center_x + board.pin_spacing  # Pushed toward the center outside these
+        self.left = board.center_x - board.pin_spacing
+        self._work = np.empty((8, 0))
+        self._side = np.empty(0, dtype=bool)
+
+    def _buffers(self, n):
+        if self._work.shape[1] < n:
+            self._work = np.empty((8, max(n, 2 * self._work.shape[1])))
+            self._side = np.empty(self._work.shape[1], dtype=bool)
+        return self._work[:, :n], self._side[:n]
+
+    def bounce(self, x, y, vx, vy, pin_x, pin_y, bias, nudge):
+        """One contact in native floats, returns the new (x, y, vx, vy)."""
+        ddx, ddy = x - pin_x, y - pin_y
+        dist = math.sqrt(ddx * ddx + ddy * ddy)
+        if dist == 0.0: nx, ny = 1.0, 0.0  # Dead center, same way out as atan2(0, 0)
+        else: nx, ny = ddx / dist, ddy / dist
+        displacement = self.radius_sum - dist + PUSH_OUT
+        x += nx * displacement
+        y += ny * displacement
+        dot = vx * nx + vy * ny
+        vx = (vx - 2 * dot * nx) * self.damp_x
+        vy = (vy - 2 * dot * ny) * self.damp_y
+        if x > self.right: vx -= bias / BIAS_SCALE
+        elif x < self.left: vx += bias / BIAS_SCALE
+        return x + nudge, y, vx, vy
+
+    def resolve(self, balls, hit, pin, bias, nudges):
+        """Apply bounce() to balls hit[i] against pins pin[i] in place, nudges[i] is each ball's nudge."""
+        if len(hit) <= SCALAR_CONTACTS:
+            # A handful of contacts (the usual game frame) is cheaper one by one than through ~30 ufunc calls
+            x, y, vx, vy = balls.x, balls.y, balls.vx, balls.vy
+            for i, p, nudge in zip(hit.tolist(), pin.tolist(), nudges.tolist()):
+                x[i], y[i], vx[i], vy[i] = self.bounce(float(x[i]), float(y[i]), float(vx[i]), float(vy[i]),
+                                                       self.pin_x[p], self.pin_y[p], bias, nudge)
+            return
+        (bx, by, vx, vy, nx, ny, t, u), side = self._buffers(len(hit))
+        np.take(balls.x, hit, out=bx)
+        np.take(balls.y, hit, out=by)
+        np.take(balls.vx, hit, out=vx)
+        np.take(balls.vy, hit, out=vy)
+        np.take(self.pins_x, pin, out=nx)
+        np.take(self.pins_y, pin, out=ny)
+        np.subtract(bx, nx, out=nx)
+        np.subtract(by, ny, out=ny)
+
+        # Unit normal from the pin to the ball, dead center balls leave to the right
+        np.multiply(nx, nx, out=t)
+        np.multiply(ny, ny, out=u)
+        t += u
+        np.sqrt(t, out=t)
+        np.equal(t, 0.0, out=side)
+        np.copyto(nx, 1.0, where=side)
+        np.copyto(t, 1.0, where=side)
+        nx /= t
+        ny /= t
+        np.copyto(t, 0.0, where=side)
+
+        # Move the ball away from the pin a bit further than the overlap
+        np.subtract(self.radius_sum, t, out=t)
+        t += PUSH_OUT
+        np.multiply(nx, t, out=u)
+        bx += u
+        np.multiply(ny, t, out=u)
+        by += u
+
+        # Reflect the velocity and dampen, more bounce in the y
+        np.multiply(vx, nx, out=t)
+        np.multiply(vy, ny, out=u)
+        t += u
+        t *= 2
+        np.multiply(t, nx, out=u)
+        vx -= u
+        vx *= self.damp_x
+        np.multiply(t, ny, out=u)
+        vy -= u
+        vy *= self.damp_y
+
+        # Push toward the center if outside the two middle columns
+        push = bias / BIAS_SCALE
+        np.greater(bx, self.right, out=side)
+        np.subtract(vx, push, out=vx, where=side)
+        np.less(bx, self.left, out=side)
+        np.add(vx, push, out=vx, where=side)
+
+        # Random nudge left or right
+        bx += nudges
+        balls.x[hit], balls.y[hit] = bx, by
+        balls.vx[hit], balls.vy[hit] = vx, vy
@@ -0,0 +1,113 @@
+'''
+Per-ball counter-based random streams
+Every ball gets its own Philox stream keyed on (session seed, ball id). Draw k of ball i is a pure
+function of (seed, i, k), so whole batches are drawn at array speed with a vectorized Philox4x64
+and any single ball can be reproduced on its own, in any worker, with generator(i).
+Draws 0 and 1 of each ball place it at the top of the board, later draws are its bounce nudges.
+'''
+import numpy as np
+
+START_DRAWS = 2  # Draws used for the start x and y before the first bounce
+
+# Philox4x64-10 constants (Salmon et al. 2011, same as numpy.random.Philox)
+PHILOX_M0 = np.uint64(0xD2E7470EE14C6C93)
+PHILOX_M1 = np.uint64(0xCA5A826395121157)
+PHILOX_W0 = np.uint64(0x9E3779B97F4A7C15)
+PHILOX_W1 = np.uint64(0xBB67AE8584CAA73B)
+PHILOX_ROUNDS = 10
+LOW_32 = np.uint64(0xFFFFFFFF)
+SHIFT_32 = np.uint64(32)
+
+
+def _mulhilo(a, b):
+    """High and low 64 bits of the 128-bit product a * b, built from 32-bit halves."""
+    a_lo, a_hi = a & LOW_32, a >> SHIFT_32
+    b_lo, b_hi = b & LOW_32, b >> SHIFT_32
+    lo_lo, lo_hi = a_lo * b_lo, a_lo * b_hi
+    hi_lo, hi_hi = a_hi * b_lo, a_hi * b_hi
+    mid = (lo_lo >> SHIFT_32) + (lo_hi & LOW_32) + (hi_lo & LOW_32)
+    hi = hi_hi + (lo_hi >> SHIFT_32) + (hi_lo >> SHIFT_32) + (mid >> SHIFT_32)
+    return hi, a * b
+
+
+def philox4x64(counter, key):
+    """Philox4x64-10 block for arrays of counters (4 words) and keys (2 words), returns 4 output words."""
+    c0, c1, c2, c3 = counter
+    k0, k1 = key
+    with np.errstate(over='ignore'):
+        for round in range(PHILOX_ROUNDS):
+            if round: k0, k1 = k0 + PHILOX_W0, k1 + PHILOX_W1
+            hi0, lo0 = _mulhilo(PHILOX_M0, c0)
+            hi1, lo1 = _mulhilo(PHILOX_M1, c2)
+            c0, c1, c2, c3 = hi1 ^ c1 ^ k0, lo1, hi0 ^ c3 ^ k1, lo0
+    return c0, c1, c2, c3
+
+
+class BallStreams:
+    """Independent random streams for every ball of a session."""
+    compiled = True  # Draws are plain Philox output, so compiled kernels can make them themselves
+
+    def __init__(self, seed=None):
+        self.seed_sequence = np.random.SeedSequence(seed)
+        self.seed = self.seed_sequence.entropy  # Pass this on to reproduce the session
+        self.key = self.seed_sequence.generate_state(1, np.uint64)[0]
+
+    def raw(self, ids, draws):
+        """Raw 64-bit output number draws[i] of ball ids[i], same as generator(ids[i]) would give."""
+        ids = np.asarray(ids, dtype=np.uint64)
+        draws = np.asarray(draws, dtype=np.uint64)
+        # numpy's Philox bumps the counter before each block of 4 outputs
+        block = draws // np.uint64(4) + np.uint64(1)
+        zero = np.zeros_like(block)
+        words = philox4x64((block, zero, zero, zero), (np.full_like(ids, self.key), ids))
+        lane = (draws % np.uint64(4)).astype(np.int64)
+        return np.choose(lane, words)
+
+    def random(self, ids, draws):
+        """Uniform floats in [0, 1), same mapping as Generator.random()."""
+        return (self.raw(ids, draws) >> np.uint64(11)) * (1.0 / 9007199254740992.0)
+
+    def generator(self, ball_id, draws=0):
+        """numpy Generator for one ball, positioned so its next random() is draw number `draws`."""
+        bit_generator = np.random.Philox(key=np.array([self.key, ball_id], dtype=np.uint64),
+                                         counter=np.array([draws // 4, 0, 0, 0], dtype=np.uint64))
+        bit_generator.random_raw(draws % 4)
+        return np.random.Generator(bit_generator)
+
+
+class MirroredStreams(BallStreams):
+    """BallStreams for antithetic pairs: odd ball 2k + 1 reuses the stream of ball 2k with every draw
+    but the start height reflected (u -> 1 - u), which mirrors its start x about the board center
+    and flips every nudge, so it retraces ball 2k's path in the mirror. Compiled kernels cannot
+    make these draws themselves, batches step with NumPy."""
+    compiled = False
+    top = 1 - 2.0 ** -53  # Largest random() value, reflecting about it keeps draws in [0, 1)
+
+    def random(self, ids, draws):
+        ids = np.asarray(ids, dtype=np.int64)
+        draws = np.asarray(draws, dtype=np.int64)
+        u = super().random(ids & ~1, draws)
+        return np.where((ids & 1).astype(bool) & (draws != 1), self.top - u, u)
+
+    def generator(self, ball_id, draws=0):
+        """MirroredGenerator for one ball, positioned so its next random() is draw number `draws`."""
+        return MirroredGenerator(super().generator(ball_id & ~1, draws), ball_id & 1, draws, self.top)
+
+
+class MirroredGenerator:
+    """The random() of a numpy Generator for one MirroredStreams ball, the only draw the physics makes.
+    An odd ball reflects the draws of its even partner's generator like MirroredStreams.random()."""
+
+    def __init__(self, generator, mirrored, draws, top):
+        self.generator = generator
+        self.mirrored = bool(mirrored)
+        self.draws = draws  # Number of the next draw
+        self.top = top
+
+    def random(self, size=None):
+        u = self.generator.random(size)
+        draws = self.draws + np.arange(np.size(u)).reshape(np.shape(u))
+        self.draws += np.size(u)
+        if not self.mirrored: return u
+        u = np.where(draws != 1, self.top - u, u)
+        return u if size is not None else float(u)
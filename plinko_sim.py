@@ -0,0 +1,221 @@
+'''
+Headless Monte Carlo drop simulator
+Drops balls with the game's physics (plinko_physics) without a display or audio and counts
+the landing bins. Work is split into chunks and spread across all cores with a process pool.
+Ball i of a run always uses stream i of BallStreams(seed), so results do not depend on how the
+drops are chunked or which worker runs them, and any single ball can be replayed with drop_one().
+Usage -
+    python plinko_sim.py --rows 16 --bias 6 --drops 1000000
+    python plinko_sim.py --rows 12 --bias 10 --drops 100000 --workers 4 --seed 7 --mode numpy
+    python plinko_sim.py --rows 12 --cols 14 --drops 100000   (rectangular pin field)
+    python plinko_sim.py --rows 16 --bias 6 --precision 0.0005   (drop until the RTP is known to +-0.05%)
+'''
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from statistics import NormalDist
+import numpy as np
+from plinko_physics import Board, PinLayout, drop_start, run_drops, step_balls_swept
+from plinko_rng import BallStreams
+from plinko_backends import BACKENDS, get_backend
+
+CHUNK_SIZE = 20000  # Drops per work unit, large enough to keep the batch step vectorized
+MIN_DROPS = 100000  # Sequential runs never stop before this, the rare top bins make early intervals too narrow
+MAX_DROPS = 100000000
+MODES = ('batch', 'swept') + BACKENDS  # batch uses the fastest installed backend, swept checks for tunneling (slower)
+
+
+def simulate_chunk(pin_rows, bias, first_id, n, seed, mode='batch', layout=None):
+    """Drop balls first_id .. first_id + n - 1 on one board and return the bin counts (length num_bins,
+    pin_rows + 1 for the pyramid, layout replaces it with another PinLayout).
+    Balls that miss every bin are not counted, so counts.sum() can be below n."""
+    board = Board(pin_rows, layout=layout)
+    streams = BallStreams(seed)
+    if mode == 'batch' or mode in BACKENDS:
+        ids = np.arange(first_id, first_id + n)
+        x, y = drop_start(board, n, streams, ids)
+        bins = get_backend('auto' if mode == 'batch' else mode).run_drops(board, x, y, bias, streams, ids=ids)
+    elif mode == 'swept':
+        ids = np.arange(first_id, first_id + n)
+        x, y = drop_start(board, n, streams, ids)
+        bins = run_drops(board, x, y, bias, streams, ids=ids, step=step_balls_swept)
+    else:
+        raise ValueError(f"Unknown mode {mode!r}, expected one of {MODES}")
+    bins = bins[(bins >= 0) & (bins < board.num_bins)]
+    return np.bincount(bins, minlength=board.num_bins)
+
+
+def drop_one(seed, ball_id, pin_rows=16, bias=6, board=None):
+    """Replay ball ball_id of a run on its own, returns the bin the run gave it."""
+    if board is None: board = Board(pin_rows)
+    streams = BallStreams(seed)
+    x, y = drop_start(board, 1, streams, [ball_id])
+    return int(get_backend('auto').run_drops(board, x, y, bias, streams, ids=[ball_id])[0])
+
+
+def split_drops(drops, chunk_size=CHUNK_SIZE):
+    """(first ball id, size) of the chunks that make up drops."""
+    return [(start, min(chunk_size, drops - start)) for start in range(0, drops, chunk_size)]
+
+
+def run_seed(seed):
+    """Seed to hand to workers, fresh entropy when seed is None so every chunk shares one session."""
+    return np.random.SeedSequence(seed).entropy
+
+
+def simulate_drops(drops, pin_rows=16, bias=6, seed=None, workers=None, mode='batch', chunk_size=CHUNK_SIZE, layout=None):
+    """Simulate drops balls for one (pin_rows, bias) setting (or a PinLayout) and return the bin counts.
+    The result only depends on seed, not on chunk_size or workers."""
+    seed = run_seed(seed)
+    chunks = split_drops(drops, chunk_size)
+    counts = np.zeros(Board(pin_rows, layout=layout).num_bins, dtype=np.int64)
+    if workers == 1 or len(chunks) <= 1:
+        for first_id, n in chunks:
+            counts += simulate_chunk(pin_rows, bias, first_id, n, seed, mode, layout)
+        return counts
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        futures = [pool.submit(simulate_chunk, pin_rows, bias, first_id, n, seed, mode, layout) for first_id, n in chunks]
+        for future in futures:
+            counts += future.result()
+    return counts
+
+
+def ordered_chunks(chunks, pin_rows, bias, seed, workers=None, mode='batch', layout=None):
+    """Generator of (size, bin counts) of chunks in order, computed ahead on a process pool.
+    Closing it early cancels the chunks that have not started."""
+    if workers == 1:
+        for first_id, n in chunks:
+            yield n, simulate_chunk(pin_rows, bias, first_id, n, seed, mode, layout)
+        return
+    workers = workers or os.cpu_count()
+    chunks = iter(chunks)
+    pool = ProcessPoolExecutor(max_workers=workers)
+    try:
+        pending = []
+        for first_id, n in chunks:
+            pending.append((n, pool.submit(simulate_chunk, pin_rows, bias, first_id, n, seed, mode, layout)))
+            if len(pending) >= 2 * workers: break  # Enough to keep every worker busy
+        while pending:
+            n, future = pending.pop(0)
+            counts = future.result()
+            for first_id, size in chunks:
+                pending.append((size, pool.submit(simulate_chunk, pin_rows, bias, first_id, size, seed, mode, layout)))
+                break
+            yield n, counts
+    finally:
+        pool.shutdown(cancel_futures=True)
+
+
+def simulate_sequential(payouts, precision, pin_rows=16, bias=6, seed=None, workers=None, mode='batch', chunk_size=CHUNK_SIZE,
+                        min_drops=MIN_DROPS, max_drops=MAX_DROPS, confidence=0.95, layout=None, progress=None):
+    """Drop balls chunk by chunk until the confidence interval of the RTP (mean of payouts[bin], balls
+    that miss every bin pay nothing) is no wider than +-precision, or max_drops have fallen.
+    Chunks are counted in ball order, so a run that stops after n drops gives the same counts as
+    simulate_drops(n) with the seed. progress(result) is called after every chunk with the running result.
+    Returns a dict: counts, drops, probs, rtp, half_width, converged, elapsed, rate (drops/s) and
+    rate_per_core, the throughput to plan other runs with."""
+    if precision <= 0: raise ValueError(f"precision must be positive, got {precision}")
+    if not 0 < min_drops <= max_drops: raise ValueError(f"Expected 0 < min_drops <= max_drops, got {min_drops} and {max_drops}")
+    payouts = np.asarray(payouts, dtype=np.float64)
+    num_bins = Board(pin_rows, layout=layout).num_bins
+    if len(payouts) != num_bins: raise ValueError(f"{len(payouts)} payouts for a board with {num_bins} bins")
+    seed = run_seed(seed)
+    z = NormalDist().inv_cdf((1 + confidence) / 2)
+    cores = 1 if workers == 1 else workers or os.cpu_count()
+    counts = np.zeros(num_bins, dtype=np.int64)
+    drops = 0
+    start = time.perf_counter()
+    chunks = ordered_chunks(split_drops(max_drops, chunk_size), pin_rows, bias, seed, workers, mode, layout)
+    try:
+        for n, chunk_counts in chunks:
+            counts += chunk_counts
+            drops += n
+            probs = counts / drops
+            rtp = float(probs @ payouts)
+            half_width = z * np.sqrt(max(probs @ payouts ** 2 - rtp * rtp, 0) / drops)
+            elapsed = time.perf_counter() - start
+            result = {'counts': counts.copy(), 'drops': drops, 'probs': probs, 'rtp': rtp, 'half_width': half_width,
+                      'converged': drops >= min_drops and half_width <= precision, 'elapsed': elapsed,
+                      'rate': drops / elapsed, 'rate_per_core': drops / elapsed / cores}
+            if progress: progress(result)
+            if result['converged']: break
+    finally:
+        chunks.close()
+    return result
+
+
+def simulate_configs(drops, configs, seed=None, workers=None, mode='batch', chunk_size=CHUNK_SIZE):
+    """Bin counts for a list of (pin_rows, bias) configurations, with the chunks of all configurations
+    sharing one process pool. Every configuration reuses the same ball streams (common random numbers),
+    so differences between configurations are not blurred by sampling noise."""
+    seed = run_seed(seed)
+    counts = [np.zeros(rows + 1, dtype=np.int64) for rows, _ in configs]
+    jobs = [(k, rows, bias, first_id, n) for k, (rows, bias) in enumerate(configs)
+            for first_id, n in split_drops(drops, chunk_size)]
+    if workers == 1:
+        for k, rows, bias, first_id, n in jobs:
+            counts[k] += simulate_chunk(rows, bias, first_id, n, seed, mode)
+        return counts
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        futures = [(k, pool.submit(simulate_chunk, rows, bias, first_id, n, seed, mode))
+                   for k, rows, bias, first_id, n in jobs]
+        for k, future in futures:
+            counts[k] += future.result()
+    return counts
+
+
+def simulate_grid(drops, rows_range, bias_range, seed=None, workers=None, mode='batch', chunk_size=CHUNK_SIZE):
+    """Bin counts (rows, bias, max bins) for every configuration of the grid, see simulate_configs()."""
+    configs = [(rows, bias) for rows in rows_range for bias in bias_range]
+    grid = np.zeros((len(rows_range), len(bias_range), max(rows_range) + 1), dtype=np.int64)
+    for (rows, bias), counts in zip(configs, simulate_configs(drops, configs, seed, workers, mode, chunk_size)):
+        grid[rows_range.index(rows), bias_range.index(bias), :rows + 1] = counts
+    return grid
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless plinko drop simulator")
+    parser.add_argument('--rows', type=int, default=16, help="number of pin rows")
+    parser.add_argument('--cols', type=int, default=None, help="pins per row of a rectangular field instead of the pyramid (every other row has one fewer)")
+    parser.add_argument('--bias', type=float, default=6, help="center bias (slider value)")
+    parser.add_argument('--drops', type=int, default=100000, help="number of balls to drop")
+    parser.add_argument('--seed', type=int, default=None, help="seed for a reproducible run")
+    parser.add_argument('--workers', type=int, default=None, help="worker processes (default all cores)")
+    parser.add_argument('--mode', choices=MODES, default='batch', help="batch stepping (or a named backend), or swept: numpy stepping with tunneling checks, slower, to compare against")
+    parser.add_argument('--precision', type=float, default=None, help="instead of --drops, drop until the 95%% interval of the RTP is this narrow (0.0005 for +-0.05%%)")
+    parser.add_argument('--max-drops', type=int, default=MAX_DROPS, help="drops to give up at with --precision")
+    args = parser.parse_args()
+
+    if args.precision is not None:
+        if args.precision <= 0: parser.error("--precision must be positive")
+        if args.cols: parser.error("--precision pays out with the pyramid's multipliers, it cannot be used with --cols")
+        if args.max_drops < MIN_DROPS: parser.error(f"--max-drops must be at least {MIN_DROPS:,d}, the least a sequential run drops")
+        from plinko_payout import payout_vector  # plinko_payout imports this module
+        last = [0.0]
+
+        def progress(result):
+            if result['elapsed'] - last[0] < 1 and not result['converged']: return
+            last[0] = result['elapsed']
+            print(f"{result['drops']:12,d} drops  RTP {100 * result['rtp']:8.3f}% +-{100 * result['half_width']:.3f}%  "
+                  f"{result['rate']:,.0f} drops/s ({result['rate_per_core']:,.0f} per core)")
+
+        result = simulate_sequential(payout_vector(args.rows), args.precision, args.rows, args.bias, args.seed, args.workers,
+                                     args.mode, max_drops=args.max_drops, progress=progress)
+        print("reached" if result['converged'] else "gave up at --max-drops", f"+-{100 * args.precision:g}% after "
+              f"{result['drops']:,d} drops in {result['elapsed']:.1f}s")
+        for bin, count in enumerate(result['counts']):
+            print(f"{bin:3d} {count:12d} {count / result['drops']:.6f}")
+        return
+
+    start = time.perf_counter()
+    layout = PinLayout.rectangle(args.rows, args.cols) if args.cols else None
+    counts = simulate_drops(args.drops, args.rows, args.bias, args.seed, args.workers, args.mode, layout=layout)
+    elapsed = time.perf_counter() - start
+    print(f"rows={args.rows} bias={args.bias} drops={args.drops} ({args.drops / elapsed:,.0f} drops/s)")
+    for bin, count in enumerate(counts):
+        print(f"{bin:3d} {count:12d} {count / args.drops:.6f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+'''
+Precomputed bin-probability tables for every (rows, bias) slider setting
+The simulated landing distribution of each configuration is stored in one compressed .npz file
+together with the physics fingerprint it was made with. The file is read on first use and
+ignored if the physics constants have changed since it was written.
+Usage -
+    python plinko_tables.py --drops 100000   (build or top up every missing configuration)
+'''
+import argparse
+import os
+import numpy as np
+from plinko_physics import physics_fingerprint
+from plinko_sim import simulate_drops
+
+# Same ranges as the Rows and Center Bias sliders in plinko_balls.py
+ROWS_RANGE = range(5, 17)
+BIAS_RANGE = range(1, 21)
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'bin_tables.npz')
+DEFAULT_DROPS = 100000
+
+
+class BinTables:
+    """Landing distributions indexed by (pin_rows, bias), loaded lazily from disk."""
+
+    def __init__(self, path=DEFAULT_PATH, rows_range=ROWS_RANGE, bias_range=BIAS_RANGE):
+        self.path = path
+        self.rows_range = rows_range
+        self.bias_range = bias_range
+        self.fingerprint = physics_fingerprint()
+        self._probs = None  # (rows, bias, bins) probabilities, NaN where not simulated yet
+        self._drops = None  # (rows, bias) drops behind each entry
+
+    def _empty(self):
+        shape = (len(self.rows_range), len(self.bias_range))
+        self._probs = np.full(shape + (max(self.rows_range) + 1,), np.nan)
+        self._drops = np.zeros(shape, dtype=np.int64)
+
+    def _load(self):
+        if self._probs is not None: return
+        self._empty()
+        if not os.path.exists(self.path): return
+        with np.load(self.path) as data:
+            if str(data['fingerprint']) != self.fingerprint: return  # Stale, physics changed
+            if tuple(data['rows_range']) != (self.rows_range.start, self.rows_range.stop): return
+            if tuple(data['bias_range']) != (self.bias_range.start, self.bias_range.stop): return
+            self._probs = data['probs']
+            self._drops = data['drops']
+
+    def save(self):
+        """Write the tables atomically next to the old file."""
+        self._load()
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + '.tmp.npz'
+        np.savez_compressed(tmp_path, probs=self._probs.astype(np.float32), drops=self._drops,
+                            fingerprint=np.array(self.fingerprint),
+                            rows_range=np.array([self.rows_range.start, self.rows_range.stop]),
+                            bias_range=np.array([self.bias_range.start, self.bias_range.stop]))
+        os.replace(tmp_path, self.path)
+
+    def _cell(self, pin_rows, bias):
+        if pin_rows not in self.rows_range or bias not in self.bias_range:
+            raise KeyError(f"No table for rows={pin_rows} bias={bias}")
+        return self.rows_range.index(pin_rows), self.bias_range.index(bias)
+
+    def lookup(self, pin_rows, bias):
+        """Stored distribution over pin_rows + 1 bins, None if it has not been simulated or is off the grid."""
+        if pin_rows not in self.rows_range or bias not in self.bias_range: return None
+        self._load()
+        cell = self._cell(pin_rows, bias)
+        if self._drops[cell] == 0: return None
+        return self._probs[cell][:pin_rows + 1].astype(np.float64)
+
+    def distribution(self, pin_rows, bias, drops=DEFAULT_DROPS, seed=None, workers=None):
+        """Stored distribution, simulated and saved first if it is missing."""
+        probs = self.lookup(pin_rows, bias)
+        if probs is None:
+            self.fill(pin_rows, bias, drops, seed, workers)
+            self.save()
+            probs = self.lookup(pin_rows, bias)
+        return probs
+
+    def fill(self, pin_rows, bias, drops=DEFAULT_DROPS, seed=None, workers=None):
+        """Simulate one configuration and store it (call save() to persist)."""
+        self._load()
+        cell = self._cell(pin_rows, bias)
+        counts = simulate_drops(drops, pin_rows, bias, seed, workers)
+        self._probs[cell] = np.nan
+        self._probs[cell][:pin_rows + 1] = counts / drops
+        self._drops[cell] = drops
+
+    def grid(self):
+        """Copy of every distribution as a (rows, bias, bins) array, NaN where not simulated."""
+        self._load()
+        grid = self._probs.astype(np.float64)
+        grid[self._drops == 0] = np.nan
+        return grid
+
+    def missing(self):
+        """(pin_rows, bias) configurations without a stored distribution."""
+        self._load()
+        return [(rows, bias) for rows in self.rows_range for bias in self.bias_range
+                if self._drops[self._cell(rows, bias)] == 0]
+
+    def build(self, drops=DEFAULT_DROPS, seed=None, workers=None):
+        """Simulate every missing configuration, saving after each so an interrupted build can resume."""
+        for rows, bias in self.missing():
+            self.fill(rows, bias, drops, None if seed is None else [seed, rows, bias], workers)
+            self.save()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the plinko bin-probability tables")
+    parser.add_argument('--drops', type=int, default=DEFAULT_DROPS, help="drops per configuration")
+    parser.add_argument('--seed', type=int, default=None, help="seed for a reproducible build")
+    parser.add_argument('--workers', type=int, default=None, help="worker processes (default all cores)")
+    parser.add_argument('--path', default=DEFAULT_PATH, help="table file")
+    args = parser.parse_args()
+
+    tables = BinTables(args.path)
+    print(f"{len(tables.missing())} configurations to simulate")
+    tables.build(args.drops, args.seed, args.workers)
+    print(f"Saved {args.path}")
+
+
+if __name__ == '__main__':
+    main()
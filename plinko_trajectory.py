@@ -0,0 +1,427 @@
+'''
+Recorded trajectory library and outcome-first "turbo" drops
+For every (rows, bias) slider setting and every bin the library keeps a few ball paths recorded
+with the real physics that end in that bin. Turbo drops sample the bin from the bin tables first
+and then replay one of those paths, so no collision physics runs per frame.
+The paths live in one memory-mapped int16 .npy file indexed by (rows, bias, bin, path), so a
+lookup is a single array index and several game processes share the same pages.
+Recordings for auditing use a chunked columnar file instead (TrajectoryRecorder / TrajectoryReader):
+quantized int16 positions, bounce events and final bins, written in chunks and read back by
+memory-mapping the file and streaming one chunk at a time.
+Usage -
+    python plinko_trajectory.py --per-bin 4   (build the library)
+    python plinko_trajectory.py --record paths.plk --rows 16 --bias 6 --drops 1000000   (record drops)
+'''
+import argparse
+import json
+import os
+import struct
+import numpy as np
+from plinko_physics import Board, BallBatch, drop_start, step_balls, physics_fingerprint
+from plinko_tables import ROWS_RANGE, BIAS_RANGE
+
+DEFAULT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+POSITIONS_FILE = 'trajectories.npy'
+INDEX_FILE = 'trajectories.json'
+POSITION_SCALE = 4  # Positions are stored in quarter pixels
+MAX_FRAMES = 1000
+
+# Recording file layout (little endian):
+#   file header  - magic, format version, position scale, physics fingerprint
+#   chunk header - paths, frames, bounces in the chunk
+#   chunk body   - per path columns (rows, bias, bin, frames, bounces), then x and y columns
+#                  for every frame of every path, then bounce frame and pin columns
+RECORD_MAGIC = b'PLKTRAJ\0'
+RECORD_VERSION = 1
+FILE_HEADER = struct.Struct('<8sHH16s')
+CHUNK_HEADER = struct.Struct('<IQQ')
+PATH_COLUMNS = (('rows', '<i2'), ('bias', '<f4'), ('bin', '<i2'), ('frames', '<i4'), ('bounces', '<i4'))
+FRAME_COLUMNS = (('x', '<i2'), ('y', '<i2'))
+BOUNCE_COLUMNS = (('bounce_frame', '<i4'), ('bounce_pin', '<i4'))
+RECORD_CHUNK = 4096  # Finished paths per chunk
+
+
+def record_drops(board, x, y, bias, rng, max_frames=MAX_FRAMES):
+    """Drop balls from (x, y) and record every frame.
+    Returns (bins, lengths, positions) where positions[i, f] is ball i after frame f + 1, held at
+    its landing position after lengths[i] frames. Balls still falling after max_frames get bin -1."""
+    n = len(x)
+    balls = BallBatch(n)
+    balls.add(x, y)
+    bins = np.full(n, -1, dtype=np.int64)
+    lengths = np.full(n, max_frames, dtype=np.int64)
+    positions = np.zeros((n, max_frames, 2), dtype=np.float32)
+    for frame in range(max_frames):
+        if balls.count == 0: break
+        live = balls.count
+        ids = balls.ids[:live].copy()
+        # No pin reaches below the last row, so a landing ball just moves this frame
+        end_x = balls.x[:live] + balls.vx[:live]
+        end_y = balls.y[:live] + balls.vy[:live]
+        _, landed_bins, landed_ids, _ = step_balls(balls, board, bias, rng)
+        still = balls.ids[:balls.count]
+        positions[still, frame, 0] = balls.x[:balls.count]
+        positions[still, frame, 1] = balls.y[:balls.count]
+        landed = np.isin(ids, landed_ids)
+        positions[ids[landed], frame, 0] = end_x[landed]
+        positions[ids[landed], frame, 1] = end_y[landed]
+        bins[landed_ids] = landed_bins
+        lengths[landed_ids] = frame + 1
+    held = np.minimum(np.arange(max_frames), lengths[:, None] - 1)
+    return bins, lengths, positions[np.arange(n)[:, None], held]
+
+
+def quantize(positions):
+    return np.rint(positions * POSITION_SCALE).astype(np.int16)
+
+
+def dequantize(positions):
+    return positions.astype(np.float64) / POSITION_SCALE
+
+
+class TrajectoryLibrary:
+    """Memory-mapped recorded paths indexed by (pin_rows, bias, bin, path)."""
+
+    def __init__(self, directory=DEFAULT_DIR):
+        self.directory = directory
+        self.positions = None  # (cells * per_bin, frames, 2) int16, memory-mapped
+        self.lengths = None  # (cells, per_bin) frames until landing, 0 where there is no path
+        self.available = None  # (cells,) paths recorded for each (rows, bias, bin)
+        self.per_bin = 0
+        self.max_bins = 0
+        self.rows_range = ROWS_RANGE
+        self.bias_range = BIAS_RANGE
+
+    def load(self):
+        """Open the library, returns False if it is missing or was built with other physics."""
+        index_path = os.path.join(self.directory, INDEX_FILE)
+        if not os.path.exists(index_path): return False
+        with open(index_path) as file:
+            index = json.load(file)
+        if index['fingerprint'] != physics_fingerprint() or index['scale'] != POSITION_SCALE: return False
+        self.rows_range = range(*index['rows_range'])
+        self.bias_range = range(*index['bias_range'])
+        self.per_bin = index['per_bin']
+        self.max_bins = max(self.rows_range) + 1
+        self.lengths = np.array(index['lengths'], dtype=np.int64).reshape(-1, self.per_bin)
+        self.available = (self.lengths > 0).sum(axis=1)
+        self.positions = np.load(os.path.join(self.directory, POSITIONS_FILE), mmap_mode='r')
+        return True
+
+    @property
+    def loaded(self):
+        return self.positions is not None
+
+    def cell(self, pin_rows, bias, bin):
+        """Flat (rows, bias, bin) index, None if the setting is outside the library."""
+        if pin_rows not in self.rows_range or bias not in self.bias_range: return None
+        return (self.rows_range.index(pin_rows) * len(self.bias_range) + self.bias_range.index(bias)) * self.max_bins + bin
+
+    def path(self, pin_rows, bias, bin, k):
+        """One recorded path as float (frames, 2) positions."""
+        cell = self.cell(pin_rows, bias, bin)
+        return dequantize(self.positions[cell * self.per_bin + k, :self.lengths[cell, k]])
+
+
+def build_library(directory=DEFAULT_DIR, per_bin=4, batch=5000, max_drops=200000, seed=None,
+                  rows_range=ROWS_RANGE, bias_range=BIAS_RANGE, max_frames=MAX_FRAMES):
+    """Record per_bin paths for every (rows, bias, bin) and write the library.
+    Paths are mirrored around the board center to fill the opposite bin. Bins still empty after
+    max_drops drops are left without paths."""
+    max_bins = max(rows_range) + 1
+    cells = len(rows_range) * len(bias_range) * max_bins
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = os.path.join(directory, POSITIONS_FILE + '.tmp')
+    positions = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=np.int16,
+                                          shape=(cells * per_bin, max_frames, 2))
+    lengths = np.zeros((cells, per_bin), dtype=np.int64)
+    seeds = iter(np.random.SeedSequence(seed).spawn(len(rows_range) * len(bias_range)))
+    for rows in rows_range:
+        board = Board(rows)
+        for bias in bias_range:
+            rng = np.random.default_rng(next(seeds))
+            base = (rows_range.index(rows) * len(bias_range) + bias_range.index(bias)) * max_bins
+            found = np.zeros(rows + 1, dtype=np.int64)
+            drops = 0
+            while found.min() < per_bin and drops < max_drops:
+                x, y = drop_start(board, batch, rng)
+                bins, frames, paths = record_drops(board, x, y, bias, rng, max_frames)
+                mirrored = paths.copy()
+                mirrored[:, :, 0] = 2 * board.center_x - mirrored[:, :, 0]
+                mirror_bins = np.where(bins >= 0, board.bin_of(mirrored[:, -1, 0]), -1)
+                for bins_i, paths_i in ((bins, paths), (mirror_bins, mirrored)):
+                    for i in np.flatnonzero((bins_i >= 0) & (bins_i <= rows)):
+                        bin = bins_i[i]
+                        if found[bin] >= per_bin: continue
+                        positions[(base + bin) * per_bin + found[bin]] = quantize(paths_i[i])
+                        lengths[base + bin, found[bin]] = frames[i]
+                        found[bin] += 1
+                drops += batch
+    # Keep only as many frames as the longest path
+    longest = max(int(lengths.max()), 1)
+    final_path = os.path.join(directory, POSITIONS_FILE)
+    trimmed = np.lib.format.open_memmap(final_path + '.trim', mode='w+', dtype=np.int16,
+                                        shape=(cells * per_bin, longest, 2))
+    trimmed[:] = positions[:, :longest]
+    trimmed.flush()
+    del positions, trimmed
+    os.remove(tmp_path)
+    os.replace(final_path + '.trim', final_path)
+    index = {'fingerprint': physics_fingerprint(), 'scale': POSITION_SCALE, 'per_bin': per_bin,
+             'rows_range': [rows_range.start, rows_range.stop], 'bias_range': [bias_range.start, bias_range.stop],
+             'lengths': lengths.ravel().tolist()}
+    with open(os.path.join(directory, INDEX_FILE), 'w') as file:
+        json.dump(index, file)
+
+
+class ReplayBatch:
+    """Turbo balls: a library path and a frame counter per ball, advanced by one array index per frame."""
+
+    def __init__(self, library, tables):
+        self.library = library
+        self.tables = tables
+        self.paths = np.empty(0, dtype=np.int64)  # Row in library.positions
+        self.ends = np.empty(0, dtype=np.int64)  # Frames until landing
+        self.bins = np.empty(0, dtype=np.int64)
+        self.frames = np.empty(0, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.paths)
+
+    def clear(self):
+        self.__init__(self.library, self.tables)
+
+    def add(self, pin_rows, bias, rng, n=1):
+        """Sample n outcomes and start their replays, returns False if turbo is unavailable for this setting."""
+        library = self.library
+        if not library.loaded: return False
+        base = library.cell(pin_rows, bias, 0)
+        probs = self.tables.lookup(pin_rows, bias) if base is not None else None
+        if probs is None: return False
+        available = library.available[base:base + pin_rows + 1]
+        probs = np.where(available > 0, probs, 0.0)  # Bins never recorded cannot be replayed
+        if probs.sum() <= 0: return False
+        bins = rng.choice(pin_rows + 1, size=n, p=probs / probs.sum())
+        ks = (rng.random(n) * available[bins]).astype(np.int64)
+        cells = base + bins
+        self.paths = np.concatenate([self.paths, cells * library.per_bin + ks])
+        self.ends = np.concatenate([self.ends, library.lengths[cells, ks]])
+        self.bins = np.concatenate([self.bins, bins])
+        self.frames = np.concatenate([self.frames, np.zeros(n, dtype=np.int64)])
+        return True
+
+    def step(self):
+        """Advance every replay one frame, returns the bins of the balls that finished."""
+        self.frames += 1
+        done = self.frames >= self.ends
+        landed = self.bins[done]
+        if done.any():
+            keep = ~done
+            self.paths, self.ends, self.bins, self.frames = self.paths[keep], self.ends[keep], self.bins[keep], self.frames[keep]
+        return landed
+
+    def settle(self):
+        """Finish every replay at once, returns their bins."""
+        landed = self.bins
+        self.clear()
+        return landed
+
+    def interpolated(self, alpha):
+        """Positions alpha (0..1) of the way from the previous frame to the current one."""
+        if len(self) == 0: return np.empty(0), np.empty(0)
+        positions = self.library.positions
+        now = dequantize(positions[self.paths, np.maximum(self.frames - 1, 0)])
+        before = dequantize(positions[self.paths, np.maximum(self.frames - 2, 0)])
+        now = before + (now - before) * alpha
+        return now[:, 0], now[:, 1]
+
+
+class TrajectoryRecorder:
+    """Records the balls of a BallBatch step by step and writes finished paths in chunks.
+    Call record_step() after every step_balls() with its results, remove_balls() for balls taken off
+    the batch any other way, and close() at the end."""
+
+    def __init__(self, path, chunk_size=RECORD_CHUNK):
+        self.file = open(path, 'wb')
+        self.file.write(FILE_HEADER.pack(RECORD_MAGIC, RECORD_VERSION, POSITION_SCALE, physics_fingerprint().encode()))
+        self.chunk_size = chunk_size
+        self.step = 0
+        self.frame_log = []  # (ids, step, x, y) per step for the balls still on the board
+        self.bounce_log = []  # (ids, step, pins) per step with bounces
+        self.finished = []  # (ids, rows, bias, bins) arrays of landed balls not written yet
+        self.pending = 0
+
+    def record_step(self, balls, board, bias, pins, landed_bins, landed_ids, hit_ids):
+        """Log the positions after a step_balls() call and the balls that bounced or landed in it."""
+        n = balls.count
+        self.frame_log.append((balls.ids[:n].copy(), self.step, quantize(balls.x[:n]), quantize(balls.y[:n])))
+        if len(hit_ids): self.bounce_log.append((hit_ids, self.step, pins))
+        if len(landed_ids):
+            self.finished.append((landed_ids, np.full(len(landed_ids), board.pin_rows), np.full(len(landed_ids), bias), landed_bins))
+            self.pending += len(landed_ids)
+        self.step += 1
+        if self.pending >= self.chunk_size: self.flush()
+
+    def remove_balls(self, ids, board=None, bias=None, bins=None):
+        """Balls that left the batch without landing in a step: with bins they were settled there
+        (settle_balls()) and their path is written up to the last recorded step, without bins they
+        were cleared away and their logged rows are dropped."""
+        ids = np.asarray(ids, dtype=np.int64)
+        if len(ids) == 0: return
+        if bins is None:
+            _, self.frame_log = self._split(self.frame_log, ids)
+            _, self.bounce_log = self._split(self.bounce_log, ids)
+            return
+        self.finished.append((ids, np.full(len(ids), board.pin_rows), np.full(len(ids), bias), np.asarray(bins)))
+        self.pending += len(ids)
+        if self.pending >= self.chunk_size: self.flush()
+
+    @staticmethod
+    def _split(log, done_ids):
+        """Rows of a log belonging to done_ids as (ids, steps, *columns) grouped by id in time order,
+        and the log with those rows removed."""
+        ids = np.concatenate([entry[0] for entry in log]) if log else np.empty(0, dtype=np.int64)
+        steps = np.repeat([entry[1] for entry in log], [len(entry[0]) for entry in log]).astype(np.int64)
+        columns = [ids, steps] + [np.concatenate(column) for column in list(zip(*log))[2:]] if log else [ids, steps]
+        done = np.isin(ids, done_ids)
+        order = np.argsort(ids[done], kind='stable')
+        picked = [column[done][order] for column in columns]
+        keep = [column[~done] for column in columns]
+        # Remaining rows stay in one entry per step so the log keeps its (ids, step, ...) shape
+        remaining = []
+        if len(keep[0]):
+            bounds = np.flatnonzero(np.diff(keep[1])) + 1
+            for part in zip(*[np.split(column, bounds) for column in keep]):
+                remaining.append((part[0], int(part[1][0])) + tuple(part[2:]))
+        return picked, remaining
+
+    def flush(self):
+        """Write every finished path as one chunk."""
+        if not self.finished: return
+        ids, rows, bias, bins = [np.concatenate(column) for column in zip(*self.finished)]
+        order = np.argsort(ids)
+        ids, rows, bias, bins = ids[order], rows[order], bias[order], bins[order]
+        frames, self.frame_log = self._split(self.frame_log, ids)
+        bounces, self.bounce_log = self._split(self.bounce_log, ids)
+        if len(frames) < 4: frames += [np.empty(0, dtype=np.int16)] * 2
+        if len(bounces) < 3: bounces += [np.empty(0, dtype=np.int64)]
+
+        # Frame counts per path and each bounce's frame relative to its path's first frame
+        frame_starts = np.searchsorted(frames[0], ids)
+        frame_counts = np.searchsorted(frames[0], ids, side='right') - frame_starts
+        bounce_counts = np.searchsorted(bounces[0], ids, side='right') - np.searchsorted(bounces[0], ids)
+        first_step = np.zeros(len(ids), dtype=np.int64)
+        has_frames = frame_counts > 0
+        first_step[has_frames] = frames[1][frame_starts[has_frames]]
+        bounce_frame = bounces[1] - np.repeat(first_step, bounce_counts)
+
+        columns = {'rows': rows, 'bias': bias, 'bin': bins, 'frames': frame_counts, 'bounces': bounce_counts,
+                   'x': frames[2], 'y': frames[3], 'bounce_frame': bounce_frame, 'bounce_pin': bounces[2]}
+        self.file.write(CHUNK_HEADER.pack(len(ids), len(frames[0]), len(bounces[0])))
+        for name, dtype in PATH_COLUMNS + FRAME_COLUMNS + BOUNCE_COLUMNS:
+            self.file.write(np.ascontiguousarray(columns[name], dtype=dtype).tobytes())
+        self.finished = []
+        self.pending = 0
+
+    def close(self):
+        """Write the remaining finished paths, balls still on the board are not saved."""
+        self.flush()
+        self.file.close()
+
+
+class TrajectoryReader:
+    """Memory-mapped view of a recording, streamed chunk by chunk or read one path at a time."""
+
+    def __init__(self, path):
+        self.data = np.memmap(path, dtype=np.uint8, mode='r')
+        magic, version, self.scale, fingerprint = FILE_HEADER.unpack_from(self.data, 0)
+        if magic != RECORD_MAGIC or version != RECORD_VERSION:
+            raise ValueError(f"{path} is not a version {RECORD_VERSION} trajectory recording")
+        self.fingerprint = fingerprint.decode()
+
+        # Only the chunk headers are read up front
+        self.chunk_offsets, self.chunk_sizes = [], []
+        offset = FILE_HEADER.size
+        while offset < len(self.data):
+            paths, frames, bounces = CHUNK_HEADER.unpack_from(self.data, offset)
+            self.chunk_offsets.append(offset)
+            self.chunk_sizes.append((paths, frames, bounces))
+            offset += CHUNK_HEADER.size
+            offset += paths * sum(np.dtype(dtype).itemsize for _, dtype in PATH_COLUMNS)
+            offset += frames * sum(np.dtype(dtype).itemsize for _, dtype in FRAME_COLUMNS)
+            offset += bounces * sum(np.dtype(dtype).itemsize for _, dtype in BOUNCE_COLUMNS)
+        self.chunk_starts = np.cumsum([0] + [size[0] for size in self.chunk_sizes])
+
+    def __len__(self):
+        return int(self.chunk_starts[-1])
+
+    def chunk(self, index):
+        """Columns of one chunk as read-only views into the file."""
+        paths, frames, bounces = self.chunk_sizes[index]
+        offset = self.chunk_offsets[index] + CHUNK_HEADER.size
+        columns = {}
+        for count, layout in ((paths, PATH_COLUMNS), (frames, FRAME_COLUMNS), (bounces, BOUNCE_COLUMNS)):
+            for name, dtype in layout:
+                columns[name] = np.frombuffer(self.data, dtype=dtype, count=count, offset=offset)
+                offset += count * np.dtype(dtype).itemsize
+        columns['frame_start'] = np.concatenate([[0], np.cumsum(columns['frames'])])
+        columns['bounce_start'] = np.concatenate([[0], np.cumsum(columns['bounces'])])
+        return columns
+
+    def chunks(self):
+        """Stream every chunk in file order."""
+        for index in range(len(self.chunk_offsets)):
+            yield self.chunk(index)
+
+    def bins(self):
+        """Final bin of every path."""
+        return np.concatenate([chunk['bin'] for chunk in self.chunks()]) if len(self) else np.empty(0, dtype=np.int16)
+
+    def path(self, i):
+        """(positions, bounce frames, bounce pins, bin) of path i, positions as float (frames, 2)."""
+        index = int(np.searchsorted(self.chunk_starts, i, side='right')) - 1
+        chunk = self.chunk(index)
+        j = i - self.chunk_starts[index]
+        frames = slice(chunk['frame_start'][j], chunk['frame_start'][j + 1])
+        bounces = slice(chunk['bounce_start'][j], chunk['bounce_start'][j + 1])
+        positions = np.stack([chunk['x'][frames], chunk['y'][frames]], axis=1).astype(np.float64) / self.scale
+        return positions, chunk['bounce_frame'][bounces], chunk['bounce_pin'][bounces], int(chunk['bin'][j])
+
+
+def record_to_file(path, board, bias, drops, rng, batch=5000, chunk_size=RECORD_CHUNK, max_frames=MAX_FRAMES):
+    """Drop balls in batches with step_balls() and record every path to a recording file."""
+    recorder = TrajectoryRecorder(path, chunk_size)
+    balls = BallBatch(batch)
+    for start in range(0, drops, batch):
+        balls.add(*drop_start(board, min(batch, drops - start), rng))
+        for _ in range(max_frames):
+            if balls.count == 0: break
+            recorder.record_step(balls, board, bias, *step_balls(balls, board, bias, rng))
+        recorder.remove_balls(balls.ids[:balls.count])  # Still falling after max_frames
+        balls.clear()
+    recorder.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the plinko trajectory library for turbo drops")
+    parser.add_argument('--per-bin', type=int, default=4, help="paths to keep for every (rows, bias, bin)")
+    parser.add_argument('--max-drops', type=int, default=200000, help="give up on rare bins after this many drops")
+    parser.add_argument('--seed', type=int, default=None, help="seed for a reproducible build")
+    parser.add_argument('--dir', default=DEFAULT_DIR, help="output directory")
+    parser.add_argument('--record', default=None, help="record drops to this file instead of building the library")
+    parser.add_argument('--rows', type=int, default=16, help="pin rows for --record")
+    parser.add_argument('--bias', type=float, default=6, help="center bias for --record")
+    parser.add_argument('--drops', type=int, default=100000, help="drops for --record")
+    args = parser.parse_args()
+    if args.record:
+        record_to_file(args.record, Board(args.rows), args.bias, args.drops, np.random.default_rng(args.seed))
+        print(f"Recorded {len(TrajectoryReader(args.record))} paths to {args.record}")
+        return
+    build_library(args.dir, args.per_bin, max_drops=args.max_drops, seed=args.seed)
+    library = TrajectoryLibrary(args.dir)
+    library.load()
+    print(f"Saved {library.positions.shape[0]} paths, {int((library.available == 0).sum())} (rows, bias, bin) cells without a path")
+
+
+if __name__ == '__main__':
+    main()